@@ -3,19 +3,75 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app.cache import InvalidationBus, ObjectCache, UserCache
+from app.database import RoutingSession, ReplicaRouter, engine_options, configure_engine
+from app.inventory import ShardedStock
+from app.order_writer import OrderWriter
+from app.outbox import Outbox
+from app.passwords import PasswordHasher
+from app.profiling import MemoryProfiler, RequestProfiler, SlowQueryLog
+from app.metrics import MetricsRegistry
+from app.ratelimit import RateLimiter
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
+replica_router = ReplicaRouter()
+order_writer = OrderWriter()
+outbox = Outbox()
+password_hasher = PasswordHasher()
+profiler = RequestProfiler()
+slow_query_log = SlowQueryLog()
+memory_profiler = MemoryProfiler()
+metrics = MetricsRegistry()
+rate_limiter = RateLimiter()
+cache_bus = InvalidationBus()
+object_cache = ObjectCache(cache_bus)
+user_cache = UserCache(cache_bus)
+sharded_stock = ShardedStock(cache_bus)
 
 def create_app(config_class=Config):
     # Create and configure the app
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS win over the profile defaults
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(app.config),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+    
     # Initialize extensions with the app
     db.init_app(app)
+    
+    # Schema and sample data come from 'flask db-init' and 'flask seed' so
+    # worker startup doesn't touch the database. Registered first so the
+    # tables exist before any other before_request hook queries them
+    if app.config.get('DB_AUTO_INIT'):
+        from app.models import lazy_init_db
+        app.before_request(lazy_init_db)
+    
+    # Ahead of the other hooks so a rejected request costs no further work
+    rate_limiter.init_app(app)
+    
     login_manager.init_app(app)
+    cache_bus.init_app(app)
+    object_cache.init_app(app)
+    user_cache.init_app(app)
+    sharded_stock.init_app(app)
+    replica_router.init_app(app)
+    order_writer.init_app(app)
+    outbox.init_app(app)
+    password_hasher.init_app(app)
+    profiler.init_app(app)
+    slow_query_log.init_app(app)
+    memory_profiler.init_app(app)
+    metrics.init_app(app)
+    
+    # Apply the connect-time hooks of the engine profile
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
     
     # Set login view for the login manager
     login_manager.login_view = 'auth.login'
@@ -35,6 +91,7 @@ def create_app(config_class=Config):
     from app.routes.orders import orders
     from app.routes.admin import admin
     from app.routes.seller import seller  # Import seller blueprint
+    from app.routes.monitoring import monitoring
     
     app.register_blueprint(main)
     app.register_blueprint(auth)
@@ -43,11 +100,10 @@ def create_app(config_class=Config):
     app.register_blueprint(orders)
     app.register_blueprint(admin)
     app.register_blueprint(seller)  # Register seller blueprint
+    app.register_blueprint(monitoring)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        from app.models import initialize_db
-        initialize_db()
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
     
     return app
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+from flask import abort
+from sqlalchemy import delete, func, select, union_all
+
+def find_order(order_id):
+    """The live order with this id, else its archived copy, else 404"""
+    from app import db
+    from app.models import ArchivedOrder, Order
+
+    return db.session.get(Order, order_id) or db.session.get(ArchivedOrder, order_id) or abort(404)
+
+def user_orders(user_id, page, per_page):
+    """One page of a customer's live and archived orders, newest first"""
+    from app import db
+    from app.models import ArchivedOrder, Order
+
+    both = union_all(
+        select(Order.id, Order.order_date).where(Order.user_id == user_id),
+        select(ArchivedOrder.id, ArchivedOrder.order_date).where(ArchivedOrder.user_id == user_id)
+    ).subquery()
+    orders = db.paginate(select(both.c.id).order_by(both.c.order_date.desc(), both.c.id.desc()),
+                         page=page, per_page=per_page)
+
+    # Ids are never reused across the two tables, see archive_orders
+    loaded = {order.id: order for model in (Order, ArchivedOrder)
+              for order in model.query.filter(model.id.in_(orders.items))}
+    orders.items = [loaded[order_id] for order_id in orders.items if order_id in loaded]
+    return orders
+
+def recent_user_orders(user_id, limit):
+    """A customer's latest live or archived orders"""
+    from app.models import ArchivedOrder, Order
+
+    orders = [order for model in (Order, ArchivedOrder) for order in model.query.filter_by(
+        user_id=user_id).order_by(model.order_date.desc()).limit(limit)]
+    return sorted(orders, key=lambda order: (order.order_date, order.id), reverse=True)[:limit]
+
+def archive_totals():
+    """(orders, sales) held in the archive"""
+    from app import db
+    from app.models import OrderArchiveTotal
+
+    totals = db.session.get(OrderArchiveTotal, 1)
+    return (totals.orders, totals.sales) if totals else (0, 0)
+
+def archive_orders(before, batch_size=500, limit=None, pause=0, echo=None):
+    """Move delivered orders placed before `before` into the archive tables.
+
+    Each batch is copied, added to the archive totals and deleted from the
+    live tables in one transaction, with the eligibility check repeated in
+    every statement so an order changed concurrently is left alone. The
+    newest order is never archived: SQLite hands the highest id out again
+    once its row is gone, and ids must stay unique across both tables.
+    Returns how many orders were moved.
+    """
+    from app import db
+    from app.models import ArchivedOrder, ArchivedOrderItem, Order, OrderArchiveTotal, OrderItem
+
+    order_columns = [column.name for column in ArchivedOrder.__table__.columns]
+    item_columns = [column.name for column in ArchivedOrderItem.__table__.columns]
+    orders, items = Order.__table__, OrderItem.__table__
+    moved = 0
+    started = time.perf_counter()
+
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        newest = db.session.query(func.max(Order.id)).scalar()
+        eligible = (Order.status == 'delivered') & (Order.order_date < before) & (Order.id < newest)
+        ids = [order_id for order_id, in db.session.query(Order.id).filter(eligible).order_by(Order.id).limit(size)]
+        if not ids:
+            break
+
+        batch = eligible & Order.id.in_(ids)
+        db.session.execute(ArchivedOrder.__table__.insert().from_select(
+            order_columns, select(*(orders.c[name] for name in order_columns)).where(batch)))
+        archived = select(ArchivedOrder.id).where(ArchivedOrder.id.in_(ids))
+        db.session.execute(ArchivedOrderItem.__table__.insert().from_select(
+            item_columns, select(*(items.c[name] for name in item_columns)).where(OrderItem.order_id.in_(archived))))
+
+        count, sales = db.session.query(func.count(), func.coalesce(func.sum(ArchivedOrder.total_price), 0)).filter(
+            ArchivedOrder.id.in_(ids)).one()
+        totals = db.session.get(OrderArchiveTotal, 1)
+        if totals is None:
+            totals = OrderArchiveTotal(id=1, orders=0, sales=0)
+            db.session.add(totals)
+        totals.orders += count
+        totals.sales += sales
+
+        db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(archived)),
+                           execution_options={'synchronize_session': False})
+        db.session.execute(delete(Order).where(Order.id.in_(archived)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+        moved += count
+        if echo:
+            echo(f'Archived {moved:,} orders ({moved / max(time.perf_counter() - started, 1e-9):,.0f}/s)')
+        if pause:
+            time.sleep(pause)  # Let request writers in between batches
+    return moved
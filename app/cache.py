@@ -0,0 +1,416 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from flask import abort
+from sqlalchemy import event
+from app.database import use_primary
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock, the in-process lock still applies
+    fcntl = None
+
+_COUNTER = struct.Struct('Q')
+
+class GenerationCounter:
+    """Shared-memory counter that every worker process maps from the same file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < _COUNTER.size:
+            os.ftruncate(self._fd, _COUNTER.size)
+        self._map = mmap.mmap(self._fd, _COUNTER.size)
+
+    def read(self):
+        """Read the current generation without taking any lock"""
+        return _COUNTER.unpack_from(self._map)[0]
+
+    def bump(self):
+        """Atomically increment the generation across processes"""
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                value = self.read() + 1
+                _COUNTER.pack_into(self._map, 0, value)
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return value
+
+class InvalidationBus:
+    """Propagate cache invalidations to every worker process.
+
+    Write paths call publish() with keys such as 'product:5' before they
+    commit. The keys are stored in the CacheInvalidation change log inside the
+    same transaction, and the shared generation counter is bumped once the
+    commit succeeds. At the start of each request every worker compares the
+    counter with the generation it last saw; only when it moved does it read
+    the new change log rows and hand the keys to its subscribed caches.
+
+    Keys are namespaced as '<kind>:<id>'; subscribers must also treat the
+    special key '*' as "drop everything".
+
+    SQLite commits one writer at a time, so change log ids become visible in
+    order. Other databases can commit a later id first; there every sync
+    also re-reads entries added in the last CACHE_BUS_OVERLAP and replays
+    the ones it hasn't seen yet.
+    """
+
+    def __init__(self, app=None):
+        self._subscribers = []
+        self._counter = None
+        self._generation = None
+        self._last_id = None
+        self._seen = set()
+        self._ordered = None
+        self._lock = threading.Lock()
+        self.retention = timedelta(hours=1)
+        self.overlap = timedelta(seconds=30)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        path = app.config.get('CACHE_BUS_PATH') or os.path.join(app.instance_path, 'cache_bus')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._counter = GenerationCounter(path)
+        self.retention = app.config.get('CACHE_BUS_RETENTION', self.retention)
+        self.overlap = app.config.get('CACHE_BUS_OVERLAP', self.overlap)
+
+        app.before_request(self.sync)
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def subscribe(self, callback):
+        """Register callback(key) to be called for every invalidated key"""
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, *keys):
+        """Record keys as invalidated by the current, not yet committed, transaction"""
+        from app import db
+        from app.models import CacheInvalidation
+
+        # Prune old entries while we already hold the write transaction
+        cutoff = datetime.utcnow() - self.retention
+        CacheInvalidation.query.filter(CacheInvalidation.date_added < cutoff).delete()
+
+        db.session.add_all([CacheInvalidation(key=key) for key in keys])
+        db.session.info.setdefault('cache_keys', set()).update(keys)
+
+    def sync(self):
+        """Replay invalidations committed by other workers since the last check"""
+        generation = self._counter.read()
+        if generation == self._generation:
+            return
+
+        from app import db
+        from app.models import CacheInvalidation
+
+        with self._lock, use_primary(db.session):
+            if generation == self._generation:
+                return
+
+            if self._last_id is None:
+                # Fresh worker, nothing cached yet, just start from the tip
+                self._last_id = db.session.query(db.func.max(CacheInvalidation.id)).scalar() or 0
+                self._generation = generation
+                return
+
+            if self._ordered is None:
+                self._ordered = db.engine.dialect.name == 'sqlite'
+            new = CacheInvalidation.id > self._last_id
+            if not self._ordered:
+                # A transaction still open at the last sync may commit a lower id later
+                cutoff = datetime.utcnow() - self.overlap
+                new = db.or_(new, CacheInvalidation.date_added >= cutoff)
+            rows = db.session.query(
+                CacheInvalidation.id, CacheInvalidation.key, CacheInvalidation.date_added
+            ).filter(new).order_by(CacheInvalidation.id).all()
+            oldest = db.session.query(db.func.min(CacheInvalidation.id)).scalar()
+            unseen = [row for row in rows if row.id not in self._seen]
+
+            if oldest is not None and oldest > self._last_id + 1:
+                # Entries we never saw were pruned, drop everything to be safe
+                self._dispatch(['*'])
+            elif unseen:
+                self._dispatch({row.key for row in unseen})
+
+            if rows:
+                self._last_id = max(self._last_id, rows[-1].id)
+            if not self._ordered:
+                self._seen = {row.id for row in rows if row.date_added >= cutoff}
+            self._generation = generation
+
+    def _dispatch(self, keys):
+        for key in keys:
+            for callback in self._subscribers:
+                callback(key)
+
+    def _after_commit(self, session):
+        keys = session.info.pop('cache_keys', None)
+        if keys:
+            # Evict locally right away, other workers catch up on their next request
+            self._dispatch(keys)
+            self._counter.bump()
+
+    def _after_rollback(self, session):
+        session.info.pop('cache_keys', None)
+
+class LRUCache:
+    """Thread-safe LRU mapping with a size cap and hit/miss counters"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every eviction so a slow loader can't re-insert stale data
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self.generation += 1
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+_PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'image',
+                   'category_id', 'store_id', 'date_added', 'is_featured', 'stock_shards')
+
+class ProductSnapshot(namedtuple('ProductSnapshot', _PRODUCT_FIELDS)):
+    """Immutable copy of a Product row that is not bound to any session"""
+    __slots__ = ()
+
+    @property
+    def category(self):
+        from app import object_cache
+        return object_cache.get_category(self.category_id)
+
+    @property
+    def available_stock(self):
+        from app import sharded_stock
+        return sharded_stock.total(self.id) if self.stock_shards else self.stock
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': self.price,
+            'image': self.image
+        }
+
+class CategorySnapshot(namedtuple('CategorySnapshot', ('id', 'name', 'description'))):
+    """Immutable copy of a Category row that is not bound to any session"""
+    __slots__ = ()
+
+# Cart item paired with its cached product, used in place of the lazy relationship
+CartLine = namedtuple('CartLine', ('id', 'product_id', 'quantity', 'product'))
+
+class ObjectCache:
+    """Read-through cache of Product and Category snapshots.
+
+    Lookups that miss load only the snapshot columns and never touch the ORM
+    identity map. Entries are evicted through the invalidation bus whenever a
+    product or category is written, in this worker or any other.
+    """
+
+    def __init__(self, bus=None):
+        self.products = LRUCache()
+        self.categories = LRUCache()
+        self._category_list = None
+
+        if bus is not None:
+            bus.subscribe(self.invalidate)
+
+    def init_app(self, app):
+        self.products.maxsize = app.config.get('PRODUCT_CACHE_SIZE', self.products.maxsize)
+        self.categories.maxsize = app.config.get('CATEGORY_CACHE_SIZE', self.categories.maxsize)
+
+    def invalidate(self, key):
+        kind, _, ident = key.partition(':')
+        if kind == 'product':
+            self.products.pop(int(ident))
+        elif kind == 'category':
+            self.categories.pop(int(ident))
+            self._category_list = None
+        elif key == '*':
+            self.products.clear()
+            self.categories.clear()
+            self._category_list = None
+
+    def get_product(self, product_id):
+        return self.get_products([product_id]).get(product_id)
+
+    def get_product_or_404(self, product_id):
+        product = self.get_product(product_id)
+        if product is None:
+            abort(404)
+        return product
+
+    def get_products(self, product_ids):
+        """Return {id: ProductSnapshot}, loading all misses with one query"""
+        from app import db
+        from app.models import Product
+
+        found = {}
+        missing = []
+        for product_id in product_ids:
+            product = self.products.get(product_id)
+            if product is None:
+                missing.append(product_id)
+            else:
+                found[product_id] = product
+
+        if missing:
+            generation = self.products.generation
+            columns = [getattr(Product, field) for field in _PRODUCT_FIELDS]
+            # Fill from the primary, a lagging replica would be cached until the next write
+            with use_primary(db.session):
+                rows = db.session.query(*columns).filter(Product.id.in_(missing)).all()
+            for row in rows:
+                product = ProductSnapshot(*row)
+                self.products.put(product.id, product, generation)
+                found[product.id] = product
+        return found
+
+    def get_category(self, category_id):
+        category = self.categories.get(category_id)
+        if category is None:
+            from app import db
+            from app.models import Category
+
+            generation = self.categories.generation
+            with use_primary(db.session):
+                row = db.session.query(Category.id, Category.name, Category.description).filter(
+                    Category.id == category_id
+                ).first()
+            if row is None:
+                return None
+            category = CategorySnapshot(*row)
+            self.categories.put(category.id, category, generation)
+        return category
+
+    def get_category_or_404(self, category_id):
+        category = self.get_category(category_id)
+        if category is None:
+            abort(404)
+        return category
+
+    def all_categories(self):
+        """Every category, cached as one list until any category changes"""
+        categories = self._category_list
+        if categories is None:
+            from app import db
+            from app.models import Category
+
+            generation = self.categories.generation
+            with use_primary(db.session):
+                rows = db.session.query(Category.id, Category.name, Category.description).order_by(Category.id).all()
+            categories = tuple(CategorySnapshot(*row) for row in rows)
+            if generation == self.categories.generation:
+                self._category_list = categories
+        return categories
+
+    def cart_lines(self, cart_items):
+        """Pair cart items with cached products instead of lazy-loading each one"""
+        products = self.get_products([item.product_id for item in cart_items])
+        return [CartLine(item.id, item.product_id, item.quantity, products[item.product_id])
+                for item in cart_items if item.product_id in products]
+
+    def stats(self):
+        return {'products': self.products.stats(), 'categories': self.categories.stats()}
+
+UserSnapshot = namedtuple('UserSnapshot', ('id', 'username', 'role', 'is_active', 'store_id'))
+
+class UserCache:
+    """Short-TTL cache of the user identity fields needed on every request.
+
+    The login manager reads it first so authentication and role checks don't
+    query the User table. Entries expire after USER_CACHE_TTL seconds and are
+    evicted through the invalidation bus when a user is edited or deleted.
+    """
+
+    def __init__(self, bus=None):
+        self.users = LRUCache()
+        self.ttl = 30
+
+        if bus is not None:
+            bus.subscribe(self.invalidate)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.users.maxsize = app.config.get('USER_CACHE_SIZE', self.users.maxsize)
+
+    def invalidate(self, key):
+        kind, _, ident = key.partition(':')
+        if kind == 'user':
+            self.users.pop(int(ident))
+        elif key == '*':
+            self.users.clear()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        entry = self.users.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        from app import db
+        from app.models import User, Store
+
+        generation = self.users.generation
+        with use_primary(db.session):
+            row = db.session.query(User.id, User.username, User.role, User.is_active, Store.id).outerjoin(
+                Store, Store.user_id == User.id
+            ).filter(User.id == user_id).first()
+        if row is None:
+            return None
+
+        snapshot = UserSnapshot(*row)
+        self.users.put(user_id, (now + self.ttl, snapshot), generation)
+        return snapshot
+
+    def stats(self):
+        return self.users.stats()
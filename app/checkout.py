@@ -0,0 +1,180 @@
+import secrets
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db, cache_bus, outbox, sharded_stock
+from app.models import CartItem, CheckoutRequest, Order, OrderItem, Product
+from app.pricing import cart_lines, compute_quote, load_quote, quote_signature
+
+class CheckoutError(Exception):
+    """Checkout could not be completed; the message is shown to the customer"""
+    
+    def __init__(self, message, category='danger'):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+class StockConflict(CheckoutError):
+    """Stock changed after it was checked; the transaction must be rolled back"""
+
+class CheckoutPending(CheckoutError):
+    """The order may still be placed; its checkout key must not be released"""
+
+def issue_checkout_key():
+    """Random key embedded in the checkout form to recognise repeated submits"""
+    return secrets.token_urlsafe(24)
+
+def claim_checkout_key(key, user_id):
+    """Reserve a checkout key before placing the order.
+    
+    Returns None when this request now owns the key. Otherwise returns the
+    order id recorded by the request that got there first, waiting up to
+    CHECKOUT_KEY_WAIT seconds for it to finish. Raises CheckoutError if it
+    still hasn't finished by then.
+    """
+    deadline = time.monotonic() + current_app.config['CHECKOUT_KEY_WAIT']
+    
+    while True:
+        try:
+            # Expired keys are removed while we hold the write lock anyway
+            cutoff = datetime.utcnow() - current_app.config['CHECKOUT_KEY_TTL']
+            CheckoutRequest.query.filter(CheckoutRequest.date_added < cutoff).delete()
+            db.session.add(CheckoutRequest(key=key, user_id=user_id))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        
+        # Someone already submitted this key, wait for their result
+        while time.monotonic() < deadline:
+            existing = db.session.get(CheckoutRequest, key)
+            if existing is None:
+                break  # The first attempt failed and released the key
+            if existing.user_id != user_id:
+                raise CheckoutError('Invalid checkout request, please try again')
+            if existing.order_id is not None:
+                return existing.order_id
+            db.session.rollback()  # End the read so the next poll sees new commits
+            time.sleep(0.05)
+        else:
+            raise CheckoutError('Your order is still being processed, please check your order history', 'info')
+
+def release_checkout_key(key):
+    """Forget a claimed key after the checkout failed so it can be retried"""
+    CheckoutRequest.query.filter_by(key=key, order_id=None).delete()
+    db.session.commit()
+
+def create_order(user_id, payment_method, shipping, checkout_key=None, quote_token=None):
+    """Turn the user's cart into an order inside the current transaction.
+    
+    The cart is loaded with current prices and stock in a single query and
+    checked before anything is written, so a CheckoutError leaves the session
+    untouched. With a quote_token from the checkout page the order must match
+    the signed lines and prices exactly. Stock is then decremented in one
+    guarded UPDATE, and sharded products take their units from the shards;
+    if another checkout got there first StockConflict is raised and the
+    transaction must be rolled back. The caller commits. A
+    claimed checkout_key is bound to the order in the same transaction.
+    """
+    lines = cart_lines(user_id)
+    
+    if not lines:
+        raise CheckoutError('Your cart is empty', 'info')
+    
+    if quote_token:
+        signed_lines = load_quote(quote_token, user_id)
+        if signed_lines is None:
+            raise CheckoutError('Your checkout session has expired, please review your order again', 'warning')
+        if signed_lines != quote_signature(lines):
+            raise CheckoutError('Your cart or prices have changed, please review your order again', 'warning')
+    
+    # Check if every product is still in stock
+    quantities = {}
+    shards = {}
+    for line in lines:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+        if line.shards:
+            shards[line.product_id] = line.shards
+        if line.stock < quantities[line.product_id]:
+            raise CheckoutError(f'Sorry, {line.name} is now out of stock or has insufficient quantity')
+    
+    quote = compute_quote(user_id, lines)
+    
+    # Create order
+    order = Order(
+        user_id=user_id,
+        total_price=quote.total,
+        payment_method=payment_method,
+        status='pending',  # Initial status
+        item_count=sum(line.quantity for line in lines),
+        first_product_name=lines[0].name,
+        **shipping
+    )
+    
+    db.session.add(order)
+    db.session.flush()  # Get order ID without committing
+    
+    # Create order items
+    db.session.add_all([
+        OrderItem(
+            order_id=order.id,
+            product_id=line.product_id,
+            product_name=line.name,
+            quantity=line.quantity,
+            price=line.price
+        )
+        for line in lines
+    ])
+    
+    # Update product stock for every unsharded line in one statement
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in shards}
+    if plain:
+        products = Product.__table__
+        quantity = db.case(plain, value=products.c.id)
+        updated = db.session.execute(
+            products.update().where(
+                products.c.id.in_(plain),
+                products.c.stock >= quantity
+            ).values(stock=products.c.stock - quantity)
+        ).rowcount
+        if updated != len(plain):
+            raise StockConflict('Sorry, some items in your cart just sold out, please review your order again')
+    
+    for product_id in sorted(shards):
+        if not sharded_stock.take(product_id, quantities[product_id], shards[product_id]):
+            raise StockConflict('Sorry, some items in your cart just sold out, please review your order again')
+    
+    # Cached product snapshots carry the old stock level; a sharded product's
+    # snapshot holds no stock and its cached shard total expires on its own
+    cache_bus.publish(*(f'product:{product_id}' for product_id in plain))
+    
+    # Process payment (simplified for this example)
+    # In a real application, you would integrate with a payment gateway here
+    if payment_method == 'credit_card':
+        # Simulate credit card payment processing
+        # In a real app, you would use a payment gateway API
+        order.status = 'paid'
+    elif payment_method == 'paypal':
+        # Simulate PayPal payment processing
+        order.status = 'paid'
+    else:  # Cash on delivery
+        order.status = 'pending'
+    
+    # Clear the cart
+    CartItem.query.filter_by(user_id=user_id).delete()
+    
+    # Remember the result for repeated submits of the same checkout form
+    if checkout_key:
+        CheckoutRequest.query.filter_by(key=checkout_key).update({'order_id': order.id})
+    
+    # Everything else happens after commit in the outbox worker
+    outbox.enqueue('order.placed', {'order_id': order.id, 'user_id': user_id}, key=f'order.placed:{order.id}')
+    
+    return order
+
+@outbox.handler('order.placed')
+def send_order_confirmation(event):
+    """Notify the customer about a new order (logged until email is set up)"""
+    data = event.data
+    current_app.logger.info('Order #%s placed by user %s', data['order_id'], data['user_id'])
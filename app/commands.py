@@ -0,0 +1,190 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db, outbox
+from app.database import copy_sqlite
+
+@click.command('db-init')
+@with_appcontext
+def db_init_command():
+    """Create missing tables, columns and indexes"""
+    from app.models import init_db
+    
+    init_db()
+    click.echo('Database schema is up to date')
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Add the sample categories, users and products to an empty database"""
+    from app.models import initialize_db
+    
+    initialize_db()
+    click.echo('Sample data is in place')
+
+@click.command('generate-data')
+@click.option('--categories', default=50, show_default=True)
+@click.option('--users', default=10000, show_default=True)
+@click.option('--stores', default=100, show_default=True, help='how many of the new users are sellers')
+@click.option('--products', default=100000, show_default=True)
+@click.option('--orders', default=200000, show_default=True)
+@click.option('--cart-items', default=20000, show_default=True)
+@click.option('--days', default=365, show_default=True, help='spread dates over this many days')
+@click.option('--end-date', type=click.DateTime(['%Y-%m-%d']), help='latest generated date [default: today]')
+@click.option('--skew', default=3.0, show_default=True, help='popularity skew, 1 is uniform')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--batch-size', default=10000, show_default=True)
+@with_appcontext
+def generate_data_command(categories, users, stores, products, orders, cart_items, days, end_date,
+                          skew, seed, batch_size):
+    """Bulk-load deterministic synthetic data for scale testing"""
+    from app.datagen import DataGenerator, PASSWORD
+    
+    started = time.perf_counter()
+    generator = DataGenerator(seed=seed, batch_size=batch_size, days=days, end=end_date, skew=skew,
+                              echo=click.echo)
+    generator.run(categories=categories, users=users, stores=stores, products=products,
+                  orders=orders, cart_items=cart_items)
+    click.echo(f'Done in {time.perf_counter() - started:.1f}s, generated users log in with {PASSWORD!r}')
+
+@click.command('replicate')
+@with_appcontext
+def replicate_command():
+    """Copy the primary SQLite database over every read replica"""
+    primary = db.engines[None]
+    for key, engine in db.engines.items():
+        if key and key.startswith('replica_'):
+            copy_sqlite(primary, engine)
+            click.echo(f'Copied primary to {key} ({engine.url.database})')
+
+@click.command('outbox-drain')
+@click.option('--loop', is_flag=True, help='Keep polling instead of exiting when idle')
+@with_appcontext
+def outbox_drain_command(loop):
+    """Process pending outbox events"""
+    processed = 0
+    while True:
+        claimed = outbox.drain()
+        processed += claimed
+        if not claimed:
+            if not loop:
+                break
+            time.sleep(outbox.poll_interval)
+    click.echo(f'Processed {processed} outbox events')
+    failed = outbox.failed_count()
+    if failed:
+        click.echo(f'{failed} outbox events failed and will not be retried', err=True)
+
+@click.command('archive-orders')
+@click.option('--days', type=int, help='archive delivered orders older than this [default: ORDER_ARCHIVE_AFTER]')
+@click.option('--batch-size', type=int, help='orders per transaction [default: ORDER_ARCHIVE_BATCH_SIZE]')
+@click.option('--limit', type=int, help='stop after this many orders')
+@with_appcontext
+def archive_orders_command(days, batch_size, limit):
+    """Move old delivered orders out of the live order tables"""
+    from app.archive import archive_orders
+    
+    age = timedelta(days=days) if days is not None else current_app.config['ORDER_ARCHIVE_AFTER']
+    before = datetime.utcnow() - age
+    moved = archive_orders(before, batch_size=batch_size or current_app.config['ORDER_ARCHIVE_BATCH_SIZE'],
+                           limit=limit, pause=current_app.config['ORDER_ARCHIVE_PAUSE'], echo=click.echo)
+    click.echo(f'Archived {moved} orders placed before {before:%Y-%m-%d}')
+
+def sweep_carts(days=None, batch_size=None):
+    from app.maintenance import sweep_cart_items
+    
+    config = current_app.config
+    before = datetime.utcnow() - (timedelta(days=days) if days is not None else config['CART_ITEM_TTL'])
+    deleted = sweep_cart_items(before, batch_size=batch_size or config['CART_SWEEP_BATCH_SIZE'],
+                               pause=config['CART_SWEEP_PAUSE'], echo=click.echo)
+    click.echo(f'Reclaimed {deleted} cart items from carts idle since {before:%Y-%m-%d %H:%M}')
+
+def purge_outbox():
+    deleted = outbox.purge()
+    click.echo(f'Purged {deleted} outbox events processed more than {outbox.retention.days} days ago')
+    failed = outbox.failed_count()
+    if failed:
+        click.echo(f'{failed} outbox events failed and will not be retried', err=True)
+
+def optimize_db(vacuum=False):
+    from app.maintenance import optimize_database
+    
+    started = time.perf_counter()
+    result = optimize_database(current_app.config['DB_VACUUM_FREE_RATIO'], force_vacuum=vacuum)
+    summary = 'Analyzed'
+    if 'pages' in result:
+        summary += f", {result['free_pages']} of {result['pages']} pages free"
+    if result['vacuumed']:
+        summary += f", vacuumed to {result['pages_after']} pages"
+    click.echo(f'{summary} in {time.perf_counter() - started:.1f}s')
+
+@click.command('sweep-carts')
+@click.option('--days', type=int, help='delete carts idle for this long [default: CART_ITEM_TTL]')
+@click.option('--batch-size', type=int, help='rows per transaction [default: CART_SWEEP_BATCH_SIZE]')
+@with_appcontext
+def sweep_carts_command(days, batch_size):
+    """Delete abandoned cart items"""
+    sweep_carts(days, batch_size)
+
+@click.command('optimize-db')
+@click.option('--vacuum', is_flag=True, help='VACUUM even if few pages are free')
+@with_appcontext
+def optimize_db_command(vacuum):
+    """Refresh planner statistics and reclaim free space"""
+    optimize_db(vacuum)
+
+@click.command('maintenance')
+@click.option('--loop', is_flag=True, help='Keep running the jobs on their intervals')
+@with_appcontext
+def maintenance_command(loop):
+    """Sweep abandoned carts, purge old outbox events and optimize the database"""
+    config = current_app.config
+    next_sweep = next_optimize = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now >= next_sweep:
+            sweep_carts()
+            purge_outbox()
+            next_sweep = now + config['CART_SWEEP_INTERVAL'].total_seconds()
+        if now >= next_optimize:
+            optimize_db()
+            next_optimize = now + config['DB_OPTIMIZE_INTERVAL'].total_seconds()
+        if not loop:
+            break
+        time.sleep(max(min(next_sweep, next_optimize) - time.monotonic(), 0))
+
+@click.command('shard-stock')
+@click.argument('product_ids', nargs=-1, type=int)
+@click.option('--featured', is_flag=True, help='also every featured product')
+@click.option('--shards', type=int, help='counters per product [default: STOCK_SHARDS]')
+@click.option('--merge', is_flag=True, help='move the stock back into a single counter')
+@with_appcontext
+def shard_stock_command(product_ids, featured, shards, merge):
+    """Split the stock of flash-sale products across several counters"""
+    from app import sharded_stock
+    from app.models import Product
+    
+    products = Product.query.filter(db.or_(Product.id.in_(product_ids), db.and_(featured, Product.is_featured)))
+    count = 0
+    for product in products.order_by(Product.id):
+        if merge:
+            sharded_stock.merge(product)
+        else:
+            sharded_stock.shard(product, shards)
+        count += 1
+    db.session.commit()
+    click.echo(f"{'Merged' if merge else 'Sharded'} the stock of {count} products")
+
+def register_commands(app):
+    app.cli.add_command(db_init_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(replicate_command)
+    app.cli.add_command(outbox_drain_command)
+    app.cli.add_command(archive_orders_command)
+    app.cli.add_command(sweep_carts_command)
+    app.cli.add_command(optimize_db_command)
+    app.cli.add_command(maintenance_command)
+    app.cli.add_command(shard_stock_command)
@@ -0,0 +1,132 @@
+import random
+import time
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from flask import g, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured engine profile"""
+    profile = config.get('DB_ENGINE_PROFILE')
+    
+    if profile == 'sqlite':
+        # The driver-level timeout is what makes writers wait instead of
+        # failing immediately with "database is locked"
+        busy_timeout = config['SQLITE_PRAGMAS'].get('busy_timeout', 5000)
+        return {'connect_args': {'timeout': busy_timeout / 1000}}
+    
+    if profile == 'server':
+        return {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True
+        }
+    
+    return {}
+
+def configure_engine(engine, config):
+    """Attach connect-time hooks for the configured engine profile"""
+    if config.get('DB_ENGINE_PROFILE') != 'sqlite' or engine.dialect.name != 'sqlite':
+        return
+    
+    pragmas = config['SQLITE_PRAGMAS']
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to a read replica when allowed.
+
+    The replica bind key is chosen per request by ReplicaRouter and kept in
+    session.info. Flushes, writes, locking reads and everything after the
+    first flush of the request go to the primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('read_replica')
+        if (replica and bind is None and not self._flushing
+                and isinstance(clause, Select) and clause._for_update_arg is None):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@contextmanager
+def use_primary(db_session):
+    """Send every query issued inside the block to the primary database"""
+    replica = db_session.info.pop('read_replica', None)
+    try:
+        yield db_session
+    finally:
+        if replica is not None and not db_session.info.get('wrote'):
+            db_session.info['read_replica'] = replica
+
+class ReplicaRouter:
+    """Route read-only endpoints to the replicas in SQLALCHEMY_BINDS.
+
+    Endpoints matching REPLICA_ENDPOINTS read from a randomly chosen
+    'replica_*' bind. Once a request writes, the client is pinned to the
+    primary for READ_YOUR_WRITES_SECONDS so the redirect that follows a
+    write sees it even if replication lags. Both flushes and bulk
+    INSERT/UPDATE/DELETE statements such as Query.delete() count as writes.
+    """
+    
+    def __init__(self, app=None):
+        self.replicas = []
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        from app import db
+        
+        self.replicas = [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica_')]
+        self.endpoints = app.config.get('REPLICA_ENDPOINTS', [])
+        self.window = app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+        if not self.replicas:
+            return
+        
+        app.before_request(self.choose_bind)
+        app.after_request(self.remember_write)
+        if not event.contains(db.session, 'after_flush', self._after_flush):
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'do_orm_execute', self._do_orm_execute)
+    
+    def choose_bind(self):
+        from app import db
+        
+        if session.get('primary_until', 0) > time.time():
+            return
+        if request.endpoint and any(fnmatch(request.endpoint, pattern) for pattern in self.endpoints):
+            db.session.info['read_replica'] = random.choice(self.replicas)
+    
+    def remember_write(self, response):
+        if g.get('db_wrote'):
+            session['primary_until'] = time.time() + self.window
+        return response
+    
+    def _after_flush(self, db_session, flush_context):
+        self._wrote(db_session)
+    
+    def _do_orm_execute(self, orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            self._wrote(orm_execute_state.session)
+    
+    def _wrote(self, db_session):
+        db_session.info.pop('read_replica', None)
+        db_session.info['wrote'] = True
+        g.db_wrote = True
+
+def copy_sqlite(source_engine, target_engine):
+    """Copy a whole SQLite database with the online backup API"""
+    source = source_engine.raw_connection()
+    target = target_engine.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+    finally:
+        target.close()
+        source.close()
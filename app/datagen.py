@@ -0,0 +1,245 @@
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from app import db, cache_bus, password_hasher
+from app.models import (CartItem, Category, Order, OrderItem, Product, Store, User,
+                        UserRole)
+from app.search import create_search_index, drop_search_triggers
+
+ADJECTIVES = ('Classic', 'Compact', 'Deluxe', 'Eco', 'Ergonomic', 'Handmade', 'Lightweight',
+              'Modern', 'Portable', 'Premium', 'Rugged', 'Smart', 'Vintage', 'Wireless')
+NOUNS = ('Backpack', 'Blender', 'Camera', 'Chair', 'Desk Lamp', 'Headphones', 'Jacket', 'Kettle',
+         'Keyboard', 'Mug', 'Novel', 'Sneakers', 'Speaker', 'Watch', 'Water Bottle')
+CITIES = (('Jakarta', 'JK'), ('Bandung', 'JB'), ('Surabaya', 'JI'), ('Medan', 'SU'),
+          ('Semarang', 'JT'), ('Denpasar', 'BA'), ('Makassar', 'SN'), ('Yogyakarta', 'YO'))
+STATUSES = ('pending', 'paid', 'shipped', 'delivered')
+STATUS_WEIGHTS = (5, 10, 15, 70)
+PAYMENT_METHODS = ('credit_card', 'paypal', 'bank_transfer')
+
+# Password of every generated account
+PASSWORD = 'password123'
+
+def skewed(rng, n, skew):
+    """Index in range(n) where low indexes are picked far more often (power law)"""
+    return int(n * rng.random() ** skew)
+
+def product_name(product_id):
+    """Deterministic name, so order items can be generated without storing it"""
+    return f'{ADJECTIVES[product_id % len(ADJECTIVES)]} {NOUNS[product_id // len(ADJECTIVES) % len(NOUNS)]} {product_id}'
+
+class DataGenerator:
+    """Bulk-load synthetic categories, users, stores, products, orders and carts.
+
+    Rows go through Core executemany inserts, one transaction per batch, with
+    durability pragmas relaxed and the loaded tables' secondary indexes
+    dropped until the load is done. Everything is derived from one seeded RNG
+    and the end date, so the same arguments always produce the same data.
+    Category and product popularity follow a power law: a few categories hold
+    most products and a few products appear in most orders.
+    """
+
+    def __init__(self, seed=0, batch_size=10000, days=365, end=None, skew=3.0, echo=print):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.end = end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.skew = skew
+        self.echo = echo
+
+    def run(self, categories=0, users=0, stores=0, products=0, orders=0, cart_items=0):
+        from app.pricing import SHIPPING_COST, TAX_RATE
+
+        self.shipping, self.tax_rate = SHIPPING_COST, TAX_RATE
+        self._progress = {}
+        tables = [Category.__table__, User.__table__, Store.__table__, Product.__table__,
+                  Order.__table__, OrderItem.__table__, CartItem.__table__]
+
+        with db.engine.connect() as conn:
+            restore = self._relax(conn)
+            indexes = [index for table in tables for index in table.indexes if not index.unique]
+            for index in indexes:
+                index.drop(conn, checkfirst=True)
+            # Indexing rows one trigger at a time is far slower than one rebuild
+            drop_search_triggers(conn)
+            conn.commit()
+            try:
+                category_ids = self._categories(conn, categories)
+                user_ids, store_ids = self._users(conn, users, stores)
+                product_ids, prices, names = self._products(conn, products, category_ids, store_ids)
+                self._orders(conn, orders, user_ids, product_ids, prices, names)
+                self._cart_items(conn, cart_items, user_ids, product_ids)
+            finally:
+                self.echo('Rebuilding indexes and statistics...')
+                for index in indexes:
+                    index.create(conn, checkfirst=True)
+                create_search_index(conn, rebuild=True)
+                conn.exec_driver_sql('ANALYZE')
+                conn.commit()
+                for statement in restore:
+                    conn.exec_driver_sql(statement)
+
+        # Bulk inserts bypass the write paths, drop every worker's caches
+        cache_bus.publish('*')
+        db.session.commit()
+
+    def _relax(self, conn):
+        """Trade durability for load speed, returning the statements that undo it"""
+        if conn.dialect.name != 'sqlite':
+            return []
+        restore = []
+        for name, value in (('synchronous', 'OFF'), ('cache_size', -262144), ('temp_store', 'MEMORY')):
+            restore.append(f'PRAGMA {name}={conn.exec_driver_sql(f"PRAGMA {name}").scalar()}')
+            conn.exec_driver_sql(f'PRAGMA {name}={value}')
+        return restore
+
+    def _next_id(self, conn, table):
+        return (conn.execute(db.select(db.func.max(table.c.id))).scalar() or 0) + 1
+
+    def _insert(self, conn, table, rows, label, total, started):
+        conn.execute(table.insert(), rows)
+        conn.commit()
+        self._progress[label] = self._progress.get(label, 0) + len(rows)
+        done = self._progress[label]
+        if done == total or done % (self.batch_size * 10) < len(rows):
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            self.echo(f'{label}: {done:,}/{total:,} ({rate:,.0f} rows/s)')
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(start + self.batch_size, total)
+
+    def _date(self):
+        return self.start + timedelta(seconds=self.rng.random() * (self.end - self.start).total_seconds())
+
+    def _categories(self, conn, count):
+        table = Category.__table__
+        first = self._next_id(conn, table)
+        started = time.perf_counter()
+        for lo, hi in self._batches(count):
+            rows = [{'id': first + i, 'name': f'{self.rng.choice(NOUNS)} {first + i}',
+                     'description': f'Synthetic category {first + i}'} for i in range(lo, hi)]
+            self._insert(conn, table, rows, 'categories', count, started)
+        # Keep the same order as ids so skewed() favours the same categories every run
+        return [category_id for category_id, in conn.execute(db.select(table.c.id).order_by(table.c.id))]
+
+    def _users(self, conn, count, store_count):
+        users, stores = User.__table__, Store.__table__
+        first = self._next_id(conn, users)
+        first_store = self._next_id(conn, stores)
+        password_hash = password_hasher.hash(PASSWORD)
+        started = time.perf_counter()
+        for lo, hi in self._batches(count):
+            rows = []
+            for i in range(lo, hi):
+                user_id = first + i
+                city, state = self.rng.choice(CITIES)
+                rows.append({
+                    'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+                    'password_hash': password_hash, 'first_name': 'User', 'last_name': str(user_id),
+                    'address': f'{self.rng.randint(1, 999)} Synthetic Street', 'city': city, 'state': state,
+                    'zip_code': f'{self.rng.randint(10000, 99999)}', 'phone': f'555-{user_id % 10000:04d}',
+                    'date_registered': self._date(), 'is_active': True,
+                    'role': UserRole.SELLER if i < store_count else UserRole.CUSTOMER
+                })
+            self._insert(conn, users, rows, 'users', count, started)
+
+        store_count = min(store_count, count)
+        rows = [{'id': first_store + i, 'name': f'Store {first_store + i}', 'user_id': first + i,
+                 'description': 'Synthetic store', 'date_created': self._date(), 'is_active': True}
+                for i in range(store_count)]
+        if rows:
+            self._insert(conn, stores, rows, 'stores', store_count, started)
+
+        customer_ids = [user_id for user_id, in conn.execute(
+            db.select(users.c.id).where(users.c.role == UserRole.CUSTOMER).order_by(users.c.id))]
+        store_ids = [store_id for store_id, in conn.execute(db.select(stores.c.id).order_by(stores.c.id))]
+        return customer_ids, store_ids
+
+    def _products(self, conn, count, category_ids, store_ids):
+        table = Product.__table__
+        first = self._next_id(conn, table)
+        started = time.perf_counter()
+        for lo, hi in self._batches(count):
+            rows = []
+            for i in range(lo, hi):
+                product_id = first + i
+                rows.append({
+                    'id': product_id, 'name': product_name(product_id),
+                    'description': f'{product_name(product_id)}, synthetic product for scale testing.',
+                    'price': round(min(self.rng.lognormvariate(3.5, 1.0), 5000), 2),
+                    'stock': self.rng.randint(0, 500), 'image': 'default_product.jpg',
+                    'category_id': category_ids[skewed(self.rng, len(category_ids), self.skew)],
+                    'store_id': self.rng.choice(store_ids) if store_ids and self.rng.random() < 0.8 else None,
+                    'date_added': self._date(), 'is_featured': self.rng.random() < 0.005
+                })
+            self._insert(conn, table, rows, 'products', count, started)
+
+        # Orders draw from every product; prices go in an array, names are only kept for
+        # rows that were not generated here
+        product_ids, prices, names = array('q'), array('d'), {}
+        for product_id, name, price in conn.execute(
+                db.select(table.c.id, table.c.name, table.c.price).order_by(table.c.id)):
+            product_ids.append(product_id)
+            prices.append(price)
+            if product_id < first:
+                names[product_id] = name
+        # Shuffle so popularity is not tied to id order, deterministically
+        order = list(range(len(product_ids)))
+        self.rng.shuffle(order)
+        return array('q', (product_ids[i] for i in order)), array('d', (prices[i] for i in order)), names
+
+    def _orders(self, conn, count, user_ids, product_ids, prices, names):
+        orders, items = Order.__table__, OrderItem.__table__
+        if not count or not user_ids or not product_ids:
+            return
+        first = self._next_id(conn, orders)
+        item_id = self._next_id(conn, items)
+        started = time.perf_counter()
+        for lo, hi in self._batches(count):
+            order_rows, item_rows = [], []
+            for i in range(lo, hi):
+                order_id = first + i
+                subtotal = 0
+                lines = []
+                for _ in range(min(1 + int(self.rng.expovariate(0.7)), 8)):
+                    index = skewed(self.rng, len(product_ids), self.skew)
+                    product_id = product_ids[index]
+                    quantity = self.rng.choice((1, 1, 1, 2, 2, 3))
+                    subtotal += quantity * prices[index]
+                    lines.append((product_id, quantity, prices[index]))
+                for product_id, quantity, price in lines:
+                    item_rows.append({'id': item_id, 'order_id': order_id, 'product_id': product_id,
+                                      'product_name': names.get(product_id) or product_name(product_id),
+                                      'quantity': quantity, 'price': price})
+                    item_id += 1
+
+                city, state = self.rng.choice(CITIES)
+                order_rows.append({
+                    'id': order_id,
+                    'user_id': user_ids[skewed(self.rng, len(user_ids), 1.5)],
+                    'order_date': self._date(),
+                    'total_price': round(subtotal * (1 + self.tax_rate) + self.shipping, 2),
+                    'status': self.rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+                    'payment_method': self.rng.choice(PAYMENT_METHODS),
+                    'shipping_address': f'{self.rng.randint(1, 999)} Synthetic Street',
+                    'shipping_city': city, 'shipping_state': state,
+                    'shipping_zip': f'{self.rng.randint(10000, 99999)}', 'shipping_phone': '555-0100',
+                    'item_count': sum(quantity for _, quantity, _ in lines),
+                    'first_product_name': item_rows[-len(lines)]['product_name']
+                })
+            self._insert(conn, orders, order_rows, 'orders', count, started)
+            conn.execute(items.insert(), item_rows)
+            conn.commit()
+
+    def _cart_items(self, conn, count, user_ids, product_ids):
+        table = CartItem.__table__
+        if not count or not user_ids or not product_ids:
+            return
+        started = time.perf_counter()
+        for lo, hi in self._batches(count):
+            rows = [{'user_id': self.rng.choice(user_ids),
+                     'product_id': product_ids[skewed(self.rng, len(product_ids), self.skew)],
+                     'quantity': self.rng.randint(1, 3), 'date_added': self._date()}
+                    for _ in range(lo, hi)]
+            self._insert(conn, table, rows, 'cart items', count, started)
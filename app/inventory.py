@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from sqlalchemy import func
+from app.database import use_primary
+
+class ShardedStock:
+    """Stock of hot products split across several counter rows.
+
+    A sharded product keeps its units in STOCK_SHARDS StockShard rows instead
+    of Product.stock, which is ignored while Product.stock_shards is set.
+    Checkout takes units from a randomly chosen shard with a guarded UPDATE
+    and falls back to the other shards, so concurrent buyers of one product
+    mostly update different rows and stock can never go negative. Buying a
+    sharded product doesn't invalidate its cached snapshot; pages read the
+    stock as the sum of the shards, cached for STOCK_SHARD_CACHE_TTL seconds
+    in each worker.
+    """
+
+    def __init__(self, bus=None):
+        self.shards = 8
+        self.ttl = 1.0
+        self._totals = {}
+        self._lock = threading.Lock()
+
+        if bus is not None:
+            bus.subscribe(self.invalidate)
+
+    def init_app(self, app):
+        self.shards = app.config.get('STOCK_SHARDS', self.shards)
+        self.ttl = app.config.get('STOCK_SHARD_CACHE_TTL', self.ttl)
+
+    def invalidate(self, key):
+        kind, _, ident = key.partition(':')
+        with self._lock:
+            if kind == 'product':
+                self._totals.pop(int(ident), None)
+            elif key == '*':
+                self._totals.clear()
+
+    def total(self, product_id):
+        """Units left in a sharded product, at most STOCK_SHARD_CACHE_TTL seconds old"""
+        now = time.monotonic()
+        entry = self._totals.get(product_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        from app import db
+        from app.models import StockShard
+
+        with use_primary(db.session):
+            total = db.session.query(func.coalesce(func.sum(StockShard.stock), 0)).filter(
+                StockShard.product_id == product_id).scalar()
+        with self._lock:
+            self._totals[product_id] = (now + self.ttl, total)
+        return total
+
+    def take(self, product_id, quantity, shards):
+        """Remove quantity units inside the current transaction, False if there aren't enough.
+
+        After a False return some shards may already be decremented, so the
+        transaction must be rolled back.
+        """
+        from app import db
+        from app.models import StockShard
+
+        start = random.randrange(shards)
+        for i in range(shards):
+            if self._decrement(product_id, (start + i) % shards, quantity):
+                return True
+
+        # No single shard holds enough, gather the units shard by shard
+        rows = db.session.query(StockShard.shard, StockShard.stock).filter(
+            StockShard.product_id == product_id, StockShard.stock > 0).order_by(StockShard.shard).all()
+        if sum(stock for _, stock in rows) < quantity:
+            return False
+        remaining = quantity
+        for shard, stock in rows:
+            units = min(stock, remaining)
+            if not self._decrement(product_id, shard, units):
+                return False  # Another checkout got there first
+            remaining -= units
+            if not remaining:
+                break
+        return True
+
+    def _decrement(self, product_id, shard, quantity):
+        from app import db
+        from app.models import StockShard
+
+        shards = StockShard.__table__
+        return db.session.execute(
+            shards.update().where(
+                shards.c.product_id == product_id,
+                shards.c.shard == shard,
+                shards.c.stock >= quantity
+            ).values(stock=shards.c.stock - quantity)
+        ).rowcount == 1
+
+    def shard(self, product, shards=None):
+        """Move a product's stock into shards, or respread it over a new number of shards"""
+        from app import db, cache_bus
+
+        shards = shards or self.shards
+        # Mark the product first so the write lock is held while the total is read
+        was_sharded = product.stock_shards
+        product.stock_shards = shards
+        db.session.flush()
+        total = self._shard_total(product.id) if was_sharded else product.stock
+        self._spread(product, total, shards)
+        product.stock = 0
+        cache_bus.publish(f'product:{product.id}')
+
+    def merge(self, product):
+        """Move a sharded product's stock back into Product.stock"""
+        from app import db, cache_bus
+        from app.models import StockShard
+
+        if not product.stock_shards:
+            return
+        product.stock_shards = 0
+        db.session.flush()
+        product.stock = self._shard_total(product.id)
+        table = StockShard.__table__
+        db.session.execute(table.delete().where(table.c.product_id == product.id))
+        cache_bus.publish(f'product:{product.id}')
+
+    def set_stock(self, product, stock):
+        """Set a product's stock from an edit form, spreading it over the shards if sharded"""
+        if product.stock_shards:
+            self._spread(product, stock, product.stock_shards)
+        else:
+            product.stock = stock
+
+    def _shard_total(self, product_id):
+        from app import db
+        from app.models import StockShard
+
+        return db.session.query(func.coalesce(func.sum(StockShard.stock), 0)).filter(
+            StockShard.product_id == product_id).scalar()
+
+    def _spread(self, product, total, shards):
+        from app import db
+        from app.models import StockShard
+
+        # Core statements, so shard rows loaded into the session can't clash with new ones
+        table = StockShard.__table__
+        db.session.execute(table.delete().where(table.c.product_id == product.id))
+        db.session.execute(table.insert(), [{'product_id': product.id, 'shard': shard,
+                                              'stock': total // shards + (shard < total % shards)}
+                                             for shard in range(shards)])
@@ -0,0 +1,73 @@
+import time
+from sqlalchemy import exists
+from sqlalchemy.orm import aliased
+from app import db, metrics
+from app.models import CartItem
+
+cart_items_swept = metrics.counter('cart_items_swept_total', 'Abandoned cart items deleted by the sweeper')
+
+def sweep_cart_items(before, batch_size=1000, pause=0, echo=None):
+    """Delete the carts of users who haven't added anything since `before`.
+
+    A cart is abandoned when its newest item is older than the cutoff, so an
+    active cart never loses its older items. The table is walked in id order
+    a batch at a time and each batch is deleted in its own short transaction,
+    which keeps the write lock free for checkouts most of the time. Returns
+    how many rows were deleted.
+    """
+    newer = aliased(CartItem)
+    last_id = 0
+    deleted = 0
+    started = time.perf_counter()
+
+    while True:
+        upper = db.session.query(CartItem.id).filter(CartItem.id > last_id).order_by(CartItem.id).offset(
+            batch_size - 1).limit(1).scalar()
+        window = CartItem.id > last_id if upper is None else CartItem.id.between(last_id + 1, upper)
+        stale = CartItem.query.filter(window, CartItem.date_added < before, ~exists().where(
+            newer.user_id == CartItem.user_id, newer.date_added >= before))
+        count = stale.delete(synchronize_session=False)
+        db.session.commit()
+
+        deleted += count
+        cart_items_swept.inc(count)
+        if upper is None:
+            break
+        last_id = upper
+        if echo and count:
+            echo(f'Deleted {deleted:,} cart items ({deleted / max(time.perf_counter() - started, 1e-9):,.0f}/s)')
+        if pause:
+            time.sleep(pause)  # Let request writers in between batches
+    return deleted
+
+def optimize_database(vacuum_free_ratio=0.2, force_vacuum=False):
+    """Refresh planner statistics and VACUUM when enough pages are free.
+
+    ANALYZE runs with a bounded analysis_limit so it samples big indexes
+    instead of reading them. VACUUM rewrites the whole file under an
+    exclusive lock, so it only runs when at least vacuum_free_ratio of the
+    pages are on the freelist, or when forced. Returns a summary dict.
+    """
+    result = {'analyzed': False, 'vacuumed': False}
+    with db.engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            conn.exec_driver_sql('ANALYZE')
+            conn.commit()
+            result['analyzed'] = True
+            return result
+
+        conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+        conn.exec_driver_sql('ANALYZE')
+        conn.commit()
+        result['analyzed'] = True
+
+        pages = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        free = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        result.update(pages=pages, free_pages=free)
+        conn.commit()
+        if force_vacuum or (pages and free / pages >= vacuum_free_ratio):
+            # VACUUM can't run inside a transaction
+            conn.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('VACUUM')
+            result['vacuumed'] = True
+            result['pages_after'] = conn.exec_driver_sql('PRAGMA page_count').scalar()
+    return result
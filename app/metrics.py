@@ -0,0 +1,352 @@
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from flask import g, request
+
+_USED = struct.Struct('i')
+_KEY_LENGTH = struct.Struct('i')
+_VALUE = struct.Struct('d')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _value_offset(position, key_length):
+    """Offset of the 8-byte aligned value that follows a key written at position"""
+    offset = position + _KEY_LENGTH.size + key_length
+    return offset + (-offset % 8)
+
+def _entries(data):
+    """Yield (key, value offset) for every entry in a value file"""
+    used = _USED.unpack_from(data)[0]
+    position = 8
+    while position < used:
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        start = position + _KEY_LENGTH.size
+        offset = _value_offset(position, length)
+        yield bytes(data[start:start + length]).decode(), offset
+        position = offset + _VALUE.size
+
+def read_values(path):
+    """Read every (key, value) pair from another process's value file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return
+    for key, offset in _entries(data):
+        yield key, _VALUE.unpack_from(data, offset)[0]
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class ValueFile:
+    """Append-only map of string keys to float64 values in a memory-mapped file.
+
+    Each worker process writes only its own file, so updates just need the
+    in-process lock; readers in other processes never lock at all.
+    """
+
+    def __init__(self, path, initial_size=1 << 16):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._size = max(os.fstat(self._fd).st_size, initial_size)
+        os.ftruncate(self._fd, self._size)
+        self._map = mmap.mmap(self._fd, self._size)
+        if _USED.unpack_from(self._map)[0] == 0:
+            _USED.pack_into(self._map, 0, 8)
+        self._used = _USED.unpack_from(self._map)[0]
+        self._offsets = dict(_entries(self._map))
+
+    def inc(self, key, amount=1):
+        with self._lock:
+            offset = self._offset(key)
+            _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            _VALUE.pack_into(self._map, self._offset(key), value)
+
+    def _offset(self, key):
+        offset = self._offsets.get(key)
+        if offset is None:
+            encoded = key.encode()
+            position = self._used
+            offset = _value_offset(position, len(encoded))
+            end = offset + _VALUE.size
+            if end > self._size:
+                self._grow(end)
+
+            _KEY_LENGTH.pack_into(self._map, position, len(encoded))
+            start = position + _KEY_LENGTH.size
+            self._map[start:start + len(encoded)] = encoded
+            _VALUE.pack_into(self._map, offset, 0.0)
+            # Publish the entry to readers only once it is complete
+            _USED.pack_into(self._map, 0, end)
+            self._used = end
+            self._offsets[key] = offset
+        return offset
+
+    def _grow(self, needed):
+        size = self._size
+        while size < needed:
+            size *= 2
+        self._map.close()
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._size = size
+
+class Metric:
+    """A counter, gauge or histogram family with a fixed set of label names"""
+
+    def __init__(self, registry, kind, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if kind == 'histogram' else ()
+        self._keys = {}
+
+    def _key(self, suffix, labels, le=None):
+        values = tuple(str(labels[name]) for name in self.labelnames)
+        cache_key = (suffix, values, le)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = self._keys[cache_key] = json.dumps([self.name + suffix, values, le])
+        return key
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        self.registry.values().inc(self._key('', labels), amount)
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        self.registry.values().set(self._key('', labels), value)
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        values = self.registry.values()
+        index = bisect.bisect_left(self.buckets, value)
+        le = self.buckets[index] if index < len(self.buckets) else '+Inf'
+        # Buckets are stored non-cumulative so one observation is three writes
+        values.inc(self._key('_bucket', labels, le))
+        values.inc(self._key('_sum', labels), value)
+        values.inc(self._key('_count', labels))
+
+class MetricsRegistry:
+    """Prometheus metrics shared by every worker process.
+
+    Each process appends its samples to its own memory-mapped file in
+    METRICS_DIR. The /metrics endpoint reads all of them and sums the values,
+    so counters survive worker restarts while gauges only count processes
+    that are still alive. Collectors refresh gauges and cache counters at most
+    once every METRICS_COLLECT_INTERVAL seconds per worker.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.directory = None
+        self.collect_interval = 5
+        self._metrics = {}
+        self._collectors = []
+        self._last_collect = 0
+        self._last_cache_counts = {}
+        self._last_hash_rejected = 0
+        self._values = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.directory = app.config.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics')
+        self.collect_interval = app.config.get('METRICS_COLLECT_INTERVAL', self.collect_interval)
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.requests = self.counter('http_requests_total', 'HTTP requests handled',
+                                     ('endpoint', 'method', 'status'))
+        self.latency = self.histogram('http_request_duration_seconds', 'HTTP request latency',
+                                      ('endpoint',))
+        self.pool = self.gauge('db_pool_connections', 'Database pool connections by state',
+                               ('bind', 'state'))
+        self.cache_requests = self.counter('cache_requests_total', 'Object cache lookups, hit ratio is '
+                                           'hit / (hit + miss)', ('cache', 'result'))
+        self.cache_entries = self.gauge('cache_entries', 'Entries held in the object caches', ('cache',))
+        self.writer_queue = self.gauge('order_writer_queue_depth', 'Orders waiting for the group-commit writer')
+        self.hash_queue = self.gauge('password_hash_queue_depth', 'Password hashes waiting for a hashing worker')
+        self.hash_rejected = self.counter('password_hash_rejected_total', 'Password hashes turned away because '
+                                          'the queue was full or the hash too slow')
+        self.collector(self._collect_pools)
+        self.collector(self._collect_caches)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register('counter', name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register('gauge', name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register('histogram', name, documentation, labelnames, buckets)
+
+    def _register(self, kind, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = Metric(self, kind, name, documentation, labelnames, buckets)
+        return metric
+
+    def collector(self, callback):
+        """Register callback() to refresh gauges before they are exported"""
+        if callback not in self._collectors:
+            self._collectors.append(callback)
+        return callback
+
+    def values(self):
+        """This process's value file, reopened after a fork"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._values = ValueFile(os.path.join(self.directory, f'{pid}.db'))
+                    self._pid = pid
+        return self._values
+
+    def collect(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_collect < self.collect_interval:
+            return
+        self._last_collect = now
+        for callback in self._collectors:
+            callback()
+
+    def _start(self):
+        g.metrics_start = time.perf_counter()
+
+    def _finish(self, response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+            self.latency.observe(time.perf_counter() - start, endpoint=endpoint)
+            self.collect()
+        return response
+
+    def _collect_pools(self):
+        from app import db, order_writer, password_hasher
+
+        for bind, engine in db.engines.items():
+            pool = engine.pool
+            # Only QueuePool keeps counts, SingletonThreadPool and NullPool don't
+            if hasattr(pool, 'checkedout'):
+                bind = bind or 'default'
+                self.pool.set(pool.checkedout(), bind=bind, state='checked_out')
+                self.pool.set(pool.checkedin(), bind=bind, state='idle')
+                self.pool.set(max(pool.overflow(), 0), bind=bind, state='overflow')
+        self.writer_queue.set(order_writer.queue_depth())
+        self.hash_queue.set(password_hasher.queue_depth())
+        # Like the cache counters, only export what changed since last time
+        rejected = password_hasher.rejected
+        self.hash_rejected.inc(rejected - self._last_hash_rejected)
+        self._last_hash_rejected = rejected
+
+    def _collect_caches(self):
+        from app import object_cache, user_cache
+
+        caches = {'products': object_cache.products, 'categories': object_cache.categories,
+                  'users': user_cache.users}
+        last = self._last_cache_counts
+        for name, cache in caches.items():
+            # LRUCache counts in-process, export only what changed since last time
+            hits, misses = cache.hits, cache.misses
+            last_hits, last_misses = last.get(name, (0, 0))
+            self.cache_requests.inc(hits - last_hits, cache=name, result='hit')
+            self.cache_requests.inc(misses - last_misses, cache=name, result='miss')
+            self.cache_entries.set(cache.stats()['size'], cache=name)
+            last[name] = (hits, misses)
+
+    def generate(self):
+        """Render the metrics of all worker processes in Prometheus text format"""
+        self.collect(force=True)
+
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            try:
+                pid = int(os.path.basename(path)[:-3])
+            except ValueError:
+                continue
+            alive = pid == os.getpid() or _pid_alive(pid)
+            for key, value in read_values(path):
+                name, values, le = json.loads(key)
+                metric = self._sample_metric(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                sample = (name, tuple(values), le)
+                totals[sample] = totals.get(sample, 0) + value
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'histogram':
+                lines.extend(self._histogram_lines(metric, totals))
+            else:
+                for (name, values, le), value in sorted(totals.items(), key=lambda item: item[0][1]):
+                    if name == metric.name:
+                        lines.append(f'{name}{_labels(metric.labelnames, values)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _sample_metric(self, name):
+        metric = self._metrics.get(name)
+        if metric is None:
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix):
+                    metric = self._metrics.get(name[:-len(suffix)])
+                    break
+        return metric
+
+    def _histogram_lines(self, metric, totals):
+        label_sets = sorted({values for (name, values, le) in totals if name == metric.name + '_count'})
+        for values in label_sets:
+            cumulative = 0
+            for le in metric.buckets + ('+Inf',):
+                cumulative += totals.get((metric.name + '_bucket', values, le), 0)
+                labels = _labels(metric.labelnames + ('le',), values + (_number(le),))
+                yield f'{metric.name}_bucket{labels} {_number(cumulative)}'
+            labels = _labels(metric.labelnames, values)
+            yield f'{metric.name}_sum{labels} {_number(totals.get((metric.name + "_sum", values, None), 0))}'
+            yield f'{metric.name}_count{labels} {_number(totals.get((metric.name + "_count", values, None), 0))}'
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -1,8 +1,10 @@
 from datetime import datetime
 import enum
+import json
+import threading
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login_manager
+from app import db, login_manager, object_cache, user_cache, password_hasher, sharded_stock
+from app.search import create_search_index
 
 # Enum untuk role pengguna
 class UserRole(enum.Enum):
@@ -12,11 +14,15 @@ class UserRole(enum.Enum):
 
 # Association table for cart items
 class CartItem(db.Model):
+    # Carts are read per user, and the sweeper finds idle carts by their newest item
+    __table_args__ = (db.Index('ix_cart_item_user_id_date_added', 'user_id', 'date_added'),)
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever the line changes, so a cart the user is still editing isn't swept
+    date_added = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     product = db.relationship('Product', backref='cart_items')
 
@@ -25,7 +31,7 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     first_name = db.Column(db.String(50))
     last_name = db.Column(db.String(50))
     address = db.Column(db.String(200))
@@ -45,16 +51,23 @@ class User(db.Model, UserMixin):
                                 cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def recent_orders(self, limit=3):
+        """Latest live or archived orders without loading the whole order list"""
+        from app.archive import recent_user_orders
+        return recent_user_orders(self.id, limit)
     
     def get_cart_count(self):
         return sum(item.quantity for item in self.cart_items)
     
     def get_cart_total(self):
-        return sum(item.quantity * item.product.price for item in self.cart_items)
+        products = object_cache.get_products([item.product_id for item in self.cart_items])
+        return sum(item.quantity * products[item.product_id].price
+                   for item in self.cart_items if item.product_id in products)
     
     @property
     def is_admin(self):
@@ -97,6 +110,16 @@ class Product(db.Model):
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
     is_featured = db.Column(db.Boolean, default=False)
     
+    # Number of StockShard rows holding the stock of a flash-sale product, 0 when
+    # the stock column is used. Managed by 'flask shard-stock'
+    stock_shards = db.Column(db.Integer, default=0)
+    stock_shard_rows = db.relationship('StockShard', lazy=True, cascade='all, delete-orphan')
+    
+    @property
+    def available_stock(self):
+        """Units for sale, summed over the shards of a sharded product"""
+        return sharded_stock.total(self.id) if self.stock_shards else self.stock
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -105,8 +128,17 @@ class Product(db.Model):
             'image': self.image
         }
 
+# One of the counters a sharded product's stock is split over
+class StockShard(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+
 # Order model
 class Order(db.Model):
+    # Order history pages filter by customer and sort by date
+    __table_args__ = (db.Index('ix_order_user_id_order_date', 'user_id', 'order_date'),)
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -119,8 +151,14 @@ class Order(db.Model):
     shipping_zip = db.Column(db.String(20))
     shipping_phone = db.Column(db.String(20))
     
+    # Denormalized summary so order lists never have to load the items
+    item_count = db.Column(db.Integer, default=0)
+    first_product_name = db.Column(db.String(100))
+    
     items = db.relationship('OrderItem', backref='order', lazy=True, 
                            cascade='all, delete-orphan')
+    
+    archived = False
 
 # Order Item model
 class OrderItem(db.Model):
@@ -133,9 +171,180 @@ class OrderItem(db.Model):
     
     product = db.relationship('Product')
 
+# Cold copies of old delivered orders, moved out by 'flask archive-orders'.
+# Same columns and ids as Order and OrderItem so rows copy over unchanged
+class ArchivedOrder(db.Model):
+    __table_args__ = (db.Index('ix_archived_order_user_id_order_date', 'user_id', 'order_date'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    order_date = db.Column(db.DateTime)
+    total_price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20))
+    payment_method = db.Column(db.String(20))
+    shipping_address = db.Column(db.String(200))
+    shipping_city = db.Column(db.String(50))
+    shipping_state = db.Column(db.String(50))
+    shipping_zip = db.Column(db.String(20))
+    shipping_phone = db.Column(db.String(20))
+    item_count = db.Column(db.Integer, default=0)
+    first_product_name = db.Column(db.String(100))
+    
+    customer = db.relationship('User')
+    items = db.relationship('ArchivedOrderItem', backref='order', lazy=True)
+    
+    # Archived orders are final, admins can look but not change them
+    archived = True
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_name = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    
+    product = db.relationship('Product')
+
+# Running totals of the archive, so dashboard stats don't scan it
+class OrderArchiveTotal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    sales = db.Column(db.Float, nullable=False, default=0)
+
+# Change log used to invalidate in-process caches across worker processes
+class CacheInvalidation(db.Model):
+    # AUTOINCREMENT keeps ids monotonic even after old rows are pruned
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)
+    date_added = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Lightweight stand-in for User returned by the login manager
+class UserIdentity(UserMixin):
+    """Current user built from the cached identity fields.
+
+    id, username, role, is_active and store_id come from the user cache, so
+    role checks cost no query. Any other attribute, method call or assignment
+    loads the full User row from the session on first use.
+    """
+    
+    def __init__(self, snapshot):
+        object.__setattr__(self, '_snapshot', snapshot)
+        object.__setattr__(self, '_user', None)
+    
+    @property
+    def user(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._snapshot.id))
+        return self._user
+    
+    @property
+    def is_active(self):
+        return self._snapshot.is_active
+    
+    @property
+    def is_admin(self):
+        return self._snapshot.role == UserRole.ADMIN
+    
+    @property
+    def is_seller(self):
+        return self._snapshot.role == UserRole.SELLER
+    
+    def __getattr__(self, name):
+        snapshot = object.__getattribute__(self, '_snapshot')
+        if name in snapshot._fields:
+            return getattr(snapshot, name)
+        return getattr(self.user, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+
+# Checkout submissions already seen, so a retried POST returns the first result
+class CheckoutRequest(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    date_added = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Side effects recorded in the same transaction as the change that caused them
+class OutboxEvent(db.Model):
+    __table_args__ = (db.Index('ix_outbox_event_status_available_at', 'status', 'available_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(50), nullable=False)
+    key = db.Column(db.String(100), unique=True)  # Optional idempotency key
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), default='pending')  # pending, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.String(200))
+    date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    snapshot = user_cache.get(int(user_id))
+    return UserIdentity(snapshot) if snapshot else None
+
+def upgrade_db():
+    """Add columns and indexes introduced after the database was created"""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = set()
+    
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                    added.add((table.name, column.name))
+            
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+        
+        # Backfill order summaries for orders placed before the columns existed
+        if ('order', 'item_count') in added:
+            conn.execute(db.text(
+                'UPDATE "order" SET '
+                'item_count = (SELECT COALESCE(SUM(quantity), 0) FROM order_item WHERE order_id = "order".id), '
+                'first_product_name = (SELECT product_name FROM order_item WHERE order_id = "order".id ORDER BY id LIMIT 1)'
+            ))
+        
+        # Trigram tables behind the admin user and order search, and their sync triggers
+        create_search_index(conn)
+
+def init_db():
+    """Create missing tables and bring existing ones up to date"""
+    db.create_all()
+    upgrade_db()
+
+_lazy_init_lock = threading.Lock()
+_lazy_init_done = False
+
+def lazy_init_db():
+    """Run init_db and initialize_db once, on the first request of the process"""
+    global _lazy_init_done
+    if _lazy_init_done:
+        return
+    with _lazy_init_lock:
+        if not _lazy_init_done:
+            init_db()
+            initialize_db()
+            _lazy_init_done = True
 
 def initialize_db():
     """Initialize the database with some sample data if empty"""
@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError
+
+OrderIntent = namedtuple('OrderIntent', ('user_id', 'payment_method', 'shipping', 'checkout_key',
+                                         'quote_token', 'future'))
+
+class OrderWriter:
+    """Single writer thread that commits queued checkouts in small batches.
+
+    With ORDER_WRITER_ENABLED, place_order submits an order intent and waits
+    on its future instead of taking the database write lock itself. The
+    writer collects up to ORDER_WRITER_BATCH_SIZE intents, waiting at most
+    ORDER_WRITER_MAX_WAIT seconds for the batch to fill, and creates all of
+    them in one transaction. A CheckoutError only fails its own intent. If
+    the commit itself fails, or an order hits a StockConflict after writing, the batch is retried one order at a time so a
+    single bad order can't take the others down with it. An intent whose
+    caller gave up waiting before the writer picked it up is dropped.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.batch_size = 32
+        self.max_wait = 0.005
+        self.timeout = 10
+        self.batches = 0
+        self.orders = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('ORDER_WRITER_ENABLED', False)
+        self.batch_size = app.config.get('ORDER_WRITER_BATCH_SIZE', self.batch_size)
+        self.max_wait = app.config.get('ORDER_WRITER_MAX_WAIT', self.max_wait)
+        self.timeout = app.config.get('ORDER_WRITER_TIMEOUT', self.timeout)
+
+    def submit(self, user_id, payment_method, shipping, checkout_key=None, quote_token=None):
+        """Queue an order and block until the writer returns its order id"""
+        from app.checkout import CheckoutError, CheckoutPending
+
+        self._ensure_started()
+        future = Future()
+        self._queue.put(OrderIntent(user_id, payment_method, shipping, checkout_key, quote_token, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise CheckoutError('Checkout is busy right now, please try again', 'warning')
+        # The writer already started on the order, it may or may not be placed
+        try:
+            return future.result(timeout=0)
+        except TimeoutError:
+            raise CheckoutPending('Your order is still being processed, please check your order history', 'info')
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker process gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='order-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            # Skip intents cancelled by callers that stopped waiting
+            batch = [intent for intent in batch if intent.future.set_running_or_notify_cancel()]
+            if batch:
+                with self.app.app_context():
+                    self._commit(batch)
+
+    def _commit(self, batch):
+        from app import db
+        from app.checkout import CheckoutError, StockConflict, create_order
+
+        results = []
+        try:
+            for intent in batch:
+                try:
+                    order = create_order(intent.user_id, intent.payment_method, intent.shipping,
+                                         intent.checkout_key, intent.quote_token)
+                    results.append((intent, order.id))
+                except StockConflict:
+                    raise  # Already wrote part of the order, fail the batch
+                except CheckoutError as e:
+                    results.append((intent, e))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+            else:
+                for intent in batch:
+                    self._commit([intent])
+            return
+
+        self.batches += 1
+        for intent, result in results:
+            if isinstance(result, Exception):
+                intent.future.set_exception(result)
+            else:
+                self.orders += 1
+                intent.future.set_result(result)
@@ -0,0 +1,190 @@
+import json
+import logging
+import secrets
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+class Outbox:
+    """Transactional outbox drained by a background worker.
+
+    enqueue() adds an OutboxEvent to the current session, so the side effect
+    is recorded if and only if the surrounding transaction commits. After
+    such a commit the in-process worker thread is woken up; it claims due
+    events in one UPDATE, runs the handler registered for each topic and
+    marks the event done in the same transaction as the handler's own
+    writes. Failures are retried with exponential backoff until
+    OUTBOX_MAX_ATTEMPTS. Delivery is at-least-once, so handlers must be
+    idempotent; the event id is a natural deduplication key. Done events
+    are kept for OUTBOX_RETENTION and then removed by purge(); failed ones
+    are kept until someone looks at them.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.worker_enabled = True
+        self.batch_size = 50
+        self.poll_interval = 5
+        self.lease = timedelta(seconds=60)
+        self.max_attempts = 5
+        self.retry_delay = 2
+        self.retention = timedelta(days=7)
+        self.failed = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db, metrics
+
+        self.app = app
+        self.worker_enabled = app.config.get('OUTBOX_WORKER_ENABLED', self.worker_enabled)
+        self.batch_size = app.config.get('OUTBOX_BATCH_SIZE', self.batch_size)
+        self.poll_interval = app.config.get('OUTBOX_POLL_INTERVAL', self.poll_interval)
+        self.lease = app.config.get('OUTBOX_LEASE', self.lease)
+        self.max_attempts = app.config.get('OUTBOX_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('OUTBOX_RETRY_DELAY', self.retry_delay)
+        self.retention = app.config.get('OUTBOX_RETENTION', self.retention)
+        self.failed = metrics.counter('outbox_events_failed_total', 'Outbox events that ran out of attempts',
+                                      ('topic',))
+
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def handler(self, topic):
+        """Decorator registering handler(event) for a topic"""
+        def decorator(f):
+            self.handlers[topic] = f
+            return f
+        return decorator
+
+    def enqueue(self, topic, payload, key=None):
+        """Record an event in the current, not yet committed, transaction"""
+        from app import db
+        from app.models import OutboxEvent
+
+        if key and OutboxEvent.query.filter_by(key=key).first():
+            return
+        db.session.add(OutboxEvent(topic=topic, key=key, payload=json.dumps(payload)))
+        db.session.info['outbox_pending'] = True
+
+    def drain(self, limit=None):
+        """Claim and process one batch of due events, returning how many were claimed"""
+        from app import db
+        from app.models import OutboxEvent
+
+        now = datetime.utcnow()
+        token = secrets.token_hex(8)
+        due = db.session.query(OutboxEvent.id).filter(
+            OutboxEvent.status == 'pending',
+            OutboxEvent.available_at <= now
+        ).order_by(OutboxEvent.id).limit(limit or self.batch_size)
+
+        # Claim the whole batch in one write; the lease hands the events to
+        # another worker if this one dies before finishing them
+        claimed = OutboxEvent.query.filter(
+            OutboxEvent.id.in_(due.scalar_subquery()),
+            OutboxEvent.status == 'pending',
+            OutboxEvent.available_at <= now
+        ).update({
+            OutboxEvent.claimed_by: token,
+            OutboxEvent.available_at: now + self.lease,
+            OutboxEvent.attempts: OutboxEvent.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return 0
+
+        event_ids = [event_id for event_id, in db.session.query(OutboxEvent.id).filter_by(
+            claimed_by=token).order_by(OutboxEvent.id)]
+        for event_id in event_ids:
+            self._process(db.session.get(OutboxEvent, event_id))
+        return len(event_ids)
+
+    def purge(self, batch_size=1000):
+        """Delete done events processed more than OUTBOX_RETENTION ago, returning how many"""
+        from app import db
+        from app.models import OutboxEvent
+
+        before = datetime.utcnow() - self.retention
+        deleted = 0
+        while True:
+            # available_at of a done event is its claim time plus the lease,
+            # so it narrows the search through the status index
+            old = db.session.query(OutboxEvent.id).filter(
+                OutboxEvent.status == 'done',
+                OutboxEvent.available_at < before + self.lease,
+                OutboxEvent.processed_at < before
+            ).limit(batch_size)
+            count = OutboxEvent.query.filter(OutboxEvent.id.in_(old.scalar_subquery())).delete(
+                synchronize_session=False)
+            db.session.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    def failed_count(self):
+        """Events that ran out of attempts and need attention"""
+        from app.models import OutboxEvent
+
+        return OutboxEvent.query.filter_by(status='failed').count()
+
+    def _process(self, outbox_event):
+        from app import db
+
+        try:
+            handler = self.handlers.get(outbox_event.topic)
+            if handler is None:
+                raise LookupError(f'No outbox handler for {outbox_event.topic}')
+            handler(outbox_event)
+            outbox_event.status = 'done'
+            outbox_event.processed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Outbox event %s (%s) failed', outbox_event.id, outbox_event.topic)
+            outbox_event.last_error = str(e)[:200]
+            if outbox_event.attempts >= self.max_attempts:
+                outbox_event.status = 'failed'
+                self.failed.inc(topic=outbox_event.topic)
+            else:
+                backoff = self.retry_delay * 2 ** (outbox_event.attempts - 1)
+                outbox_event.available_at = datetime.utcnow() + timedelta(seconds=backoff)
+            db.session.commit()
+
+    def _after_commit(self, session):
+        if session.info.pop('outbox_pending', None) and self.worker_enabled:
+            self._ensure_started()
+            self._wake.set()
+
+    def _after_rollback(self, session):
+        # The enqueued events were rolled back with the transaction
+        session.info.pop('outbox_pending', None)
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker process gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        """Drain due events forever, waking early whenever new ones are committed"""
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    while self.drain():
+                        pass
+            except Exception:
+                logger.exception('Outbox worker failed to drain events')
@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Werkzeug's defaults, so 'scrypt' and 'pbkdf2' compare equal to the method
+# prefix stored in the hashes they produce
+DEFAULT_PARAMETERS = {'scrypt': 'scrypt:32768:8:1', 'pbkdf2': 'pbkdf2:sha256:600000'}
+
+class HashingBusy(Exception):
+    """The hashing queue is full or a hash didn't finish in time"""
+
+def normalize_method(method):
+    """Full method string as stored in the hash, e.g. 'pbkdf2:sha256' -> 'pbkdf2:sha256:600000'"""
+    if method in DEFAULT_PARAMETERS:
+        return DEFAULT_PARAMETERS[method]
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:600000'
+    return method
+
+class PasswordHasher:
+    """Bounded thread pool for hashing and verifying passwords.
+
+    Requests hand the work to PASSWORD_HASH_WORKERS threads and wait for the
+    result, so expensive hashes can only use that many cores and a burst of
+    logins queues up instead of starving page requests. hashlib releases the
+    GIL while hashing, so the workers run in parallel with request threads.
+    When PASSWORD_HASH_QUEUE_SIZE hashes are already waiting, or a hash takes
+    longer than PASSWORD_HASH_TIMEOUT seconds, HashingBusy is raised.
+    Hashes made with another method than PASSWORD_HASH_METHOD are reported by
+    needs_rehash() so they can be upgraded at the next successful login.
+    """
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_PARAMETERS['scrypt']
+        self.workers = 2
+        self.queue_size = 32
+        self.timeout = 10
+        self.rejected = 0
+        self._queued = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config.get('PASSWORD_HASH_METHOD', self.method))
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', self.queue_size)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._submit(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether pwhash was made with another method or cost than configured"""
+        return bool(pwhash) and pwhash.split('$', 1)[0] != self.method
+
+    def queue_depth(self):
+        """Hashes waiting for a free worker"""
+        return self._queued
+
+    def _pool(self):
+        # Worker threads don't survive a fork, each process gets its own pool
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+                    self._queued = 0
+                    self._pid = pid
+        return self._executor
+
+    def _submit(self, func, *args):
+        pool = self._pool()
+        with self._lock:
+            if self._queued >= self.queue_size:
+                self.rejected += 1
+                raise HashingBusy('Too many sign-ins right now, please try again in a moment')
+            self._queued += 1
+        future = pool.submit(self._call, func, args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # A hash that already started can't be stopped, only a queued one
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy('Signing in is taking too long right now, please try again')
+
+    def _call(self, func, args):
+        with self._lock:
+            self._queued -= 1
+        return func(*args)
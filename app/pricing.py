@@ -0,0 +1,53 @@
+from collections import namedtuple
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from app import db
+from app.models import CartItem, Product, StockShard
+
+SHIPPING_COST = 10.00  # Fixed shipping cost
+TAX_RATE = 0.08        # 8% tax
+
+QuoteLine = namedtuple('QuoteLine', ('product_id', 'name', 'quantity', 'price', 'stock', 'shards'))
+Quote = namedtuple('Quote', ('user_id', 'lines', 'subtotal', 'shipping', 'tax', 'total'))
+
+def cart_lines(user_id):
+    """Cart contents joined with current product name, price and stock in one query"""
+    # Sharded products keep their stock in StockShard rows
+    shard_stock = db.session.query(db.func.coalesce(db.func.sum(StockShard.stock), 0)).filter(
+        StockShard.product_id == Product.id).scalar_subquery()
+    stock = db.case((Product.stock_shards > 0, shard_stock), else_=Product.stock)
+    rows = db.session.query(
+        CartItem.product_id, Product.name, CartItem.quantity, Product.price, stock, Product.stock_shards
+    ).join(Product, Product.id == CartItem.product_id).filter(
+        CartItem.user_id == user_id
+    ).order_by(CartItem.id).all()
+    return [QuoteLine(*row) for row in rows]
+
+def compute_quote(user_id, lines=None):
+    """Price the user's cart; pass lines to reuse an already loaded cart"""
+    if lines is None:
+        lines = cart_lines(user_id)
+    subtotal = sum(line.quantity * line.price for line in lines)
+    tax = subtotal * TAX_RATE
+    return Quote(user_id, lines, subtotal, SHIPPING_COST, tax, subtotal + SHIPPING_COST + tax)
+
+def quote_signature(lines):
+    """The part of a quote that must be unchanged when the order is placed"""
+    return [[line.product_id, line.quantity, line.price] for line in lines]
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='checkout-quote')
+
+def sign_quote(quote):
+    """Short-lived token proving which lines and prices the customer was shown"""
+    return _serializer().dumps({'user_id': quote.user_id, 'lines': quote_signature(quote.lines)})
+
+def load_quote(token, user_id):
+    """Return the signed lines of a valid, unexpired token for user_id, else None"""
+    try:
+        data = _serializer().loads(token, max_age=current_app.config['CHECKOUT_QUOTE_TTL'])
+    except BadSignature:
+        return None
+    if data.get('user_id') != user_id:
+        return None
+    return data['lines']
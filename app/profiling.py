@@ -0,0 +1,385 @@
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict, deque, namedtuple
+from datetime import datetime
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from app.utils import percentile
+
+RequestSample = namedtuple('RequestSample', ('endpoint', 'status', 'total', 'sql_count', 'sql_time', 'render_time'))
+
+class RequestProfiler:
+    """Measure SQL, template rendering and total time of every request.
+
+    The numbers are sent back in a Server-Timing header and the last
+    PROFILER_SAMPLES requests are kept in a ring buffer, summarised per
+    endpoint on the admin monitoring page.
+    """
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        self.samples = deque(maxlen=1000)
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        from app import db
+        
+        self.enabled = app.config.get('PROFILER_ENABLED', self.enabled)
+        self.samples = deque(maxlen=app.config.get('PROFILER_SAMPLES', self.samples.maxlen))
+        if not self.enabled:
+            return
+        
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+    
+    def _start(self):
+        g.profile = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0,
+                     'render_time': 0.0, 'render_start': []}
+    
+    def _finish(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        
+        total = time.perf_counter() - profile['start']
+        response.headers.add('Server-Timing',
+                             f'sql;dur={profile["sql_time"] * 1000:.1f};desc="{profile["sql_count"]} queries", '
+                             f'render;dur={profile["render_time"] * 1000:.1f}, '
+                             f'total;dur={total * 1000:.1f}')
+        self.samples.append(RequestSample(
+            request.endpoint or '<unmatched>', response.status_code, total,
+            profile['sql_count'], profile['sql_time'], profile['render_time']
+        ))
+        return response
+    
+    def _render_started(self, sender, template, context, **extra):
+        if has_request_context() and 'profile' in g:
+            g.profile['render_start'].append(time.perf_counter())
+    
+    def _render_finished(self, sender, template, context, **extra):
+        if has_request_context() and 'profile' in g and g.profile['render_start']:
+            g.profile['render_time'] += time.perf_counter() - g.profile['render_start'].pop()
+    
+    # The start time lives on the execution context, which is discarded with a
+    # failed statement instead of piling up on the pooled connection
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context.profile_start = time.perf_counter()
+    
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.profile_start
+        if has_request_context() and 'profile' in g:
+            g.profile['sql_count'] += 1
+            g.profile['sql_time'] += elapsed
+    
+    def summary(self):
+        """Aggregate the buffered samples per endpoint, slowest total time first"""
+        by_endpoint = {}
+        for sample in list(self.samples):
+            by_endpoint.setdefault(sample.endpoint, []).append(sample)
+        
+        rows = []
+        for endpoint, samples in by_endpoint.items():
+            count = len(samples)
+            totals = [sample.total * 1000 for sample in samples]
+            rows.append({
+                'endpoint': endpoint,
+                'count': count,
+                'errors': sum(1 for sample in samples if sample.status >= 500),
+                'avg_ms': sum(totals) / count,
+                'p95_ms': percentile(totals, 95),
+                'max_ms': max(totals),
+                'avg_queries': sum(sample.sql_count for sample in samples) / count,
+                'avg_sql_ms': sum(sample.sql_time for sample in samples) * 1000 / count,
+                'avg_render_ms': sum(sample.render_time for sample in samples) * 1000 / count,
+                'total_ms': sum(totals)
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+def fingerprint(statement):
+    """Normalize a statement so queries differing only in literals group together"""
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _IN_LIST.sub('(...)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+def redact(parameters):
+    """Replace bound parameter values with their type names"""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return type(parameters)(redact(value) for value in parameters)
+    if parameters is None:
+        return None
+    return f'<{type(parameters).__name__}>'
+
+class SlowQuery:
+    """Every slow execution of one statement fingerprint seen by this worker"""
+
+    def __init__(self, statement, samples):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.durations = deque(maxlen=samples)
+        self.endpoints = Counter()
+        self.parameters = None
+        self.plan = None
+        self.plan_time = 0
+        self.last_seen = None
+
+    @property
+    def p50(self):
+        return percentile(list(self.durations), 50)
+
+    @property
+    def p95(self):
+        return percentile(list(self.durations), 95)
+
+class SlowQueryLog:
+    """Log statements slower than SLOW_QUERY_THRESHOLD seconds.
+
+    Each slow statement is logged with its parameters redacted, the endpoint
+    that ran it and its query plan, explained on the same connection right
+    after it finished. Entries are grouped by statement fingerprint so the
+    admin page can show counts and latency percentiles per query shape.
+    """
+    
+    def __init__(self, app=None):
+        self.threshold = None
+        self.max_entries = 200
+        self.samples = 200
+        self.explain_interval = 60
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        from app import db
+        
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD', self.threshold)
+        self.max_entries = app.config.get('SLOW_QUERY_MAX_ENTRIES', self.max_entries)
+        self.samples = app.config.get('SLOW_QUERY_SAMPLES', self.samples)
+        self.explain_interval = app.config.get('SLOW_QUERY_EXPLAIN_INTERVAL', self.explain_interval)
+        self.logger = app.logger
+        if self.threshold is None:
+            return
+        
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+    
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context.slow_query_start = time.perf_counter()
+    
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.slow_query_start
+        if elapsed >= self.threshold:
+            self.record(conn, statement, parameters, elapsed, executemany)
+    
+    def record(self, conn, statement, parameters, elapsed, executemany=False):
+        if has_request_context():
+            endpoint = request.endpoint or '<unmatched>'
+        else:
+            endpoint = f'<{threading.current_thread().name}>'
+        key = fingerprint(statement)
+        
+        with self._lock:
+            entry = self.entries.pop(key, None) or SlowQuery(key, self.samples)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            
+            entry.count += 1
+            entry.total += elapsed
+            entry.max = max(entry.max, elapsed)
+            entry.durations.append(elapsed)
+            entry.endpoints[endpoint] += 1
+            entry.parameters = redact(parameters)
+            entry.last_seen = datetime.utcnow()
+            explain = (not executemany and _EXPLAINABLE.match(statement)
+                       and time.monotonic() - entry.plan_time >= self.explain_interval)
+            if explain:
+                entry.plan_time = time.monotonic()
+        
+        if explain:
+            entry.plan = self._explain(conn, statement, parameters)
+        self.logger.warning('Slow query (%.1f ms) in %s: %s params=%s\n%s', elapsed * 1000, endpoint,
+                            key, entry.parameters, entry.plan or '')
+    
+    def _explain(self, conn, statement, parameters):
+        # Use the raw DBAPI cursor so the EXPLAIN doesn't go through these events again
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.close()
+        
+        if conn.dialect.name != 'sqlite':
+            return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+        
+        # SQLite rows are (id, parent, notused, detail), indent by tree depth
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return '\n'.join(lines)
+    
+    def summary(self):
+        """Slow query fingerprints, highest total time first"""
+        with self._lock:
+            entries = list(self.entries.values())
+        return sorted(entries, key=lambda entry: entry.total, reverse=True)
+    
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+class EndpointMemory:
+    """Allocation totals of the sampled requests of one endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.peak_total = 0
+        self.peak_max = 0
+        self.retained_total = 0
+        self.sites = Counter()
+
+    @property
+    def peak_avg(self):
+        return self.peak_total / self.count if self.count else 0
+
+    @property
+    def retained_avg(self):
+        return self.retained_total / self.count if self.count else 0
+
+    def top_sites(self, limit=10):
+        """(site, average bytes per sampled request) of the largest allocation sites"""
+        return [(site, size / self.count) for site, size in self.sites.most_common(limit)]
+
+class MemoryProfiler:
+    """Opt-in tracemalloc sampling of whole requests.
+
+    A MEMORY_PROFILER_SAMPLE_RATE fraction of requests is traced, one at a
+    time per worker since tracing is process wide. Each sample records the
+    peak traced memory, what was still allocated when the request finished,
+    and the allocation sites responsible, attributed to the innermost frame in
+    the app package so ORM internals show up as the route line that ran them.
+    """
+    
+    def __init__(self, app=None):
+        self.sample_rate = 0
+        self.frames = 15
+        self.root = None
+        self.endpoints = {}
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.sample_rate = app.config.get('MEMORY_PROFILER_SAMPLE_RATE', self.sample_rate)
+        self.frames = app.config.get('MEMORY_PROFILER_FRAMES', self.frames)
+        self.root = app.root_path + os.sep
+        if not self.sample_rate:
+            return
+        
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+    
+    def _start(self):
+        if random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            return
+        
+        # Leave tracing alone if it was already on, e.g. via PYTHONTRACEMALLOC
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.frames)
+        baseline = None if started else tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        g.memory_profile = (started, baseline, tracemalloc.get_traced_memory()[0])
+    
+    def _finish(self, exc=None):
+        state = g.pop('memory_profile', None)
+        if state is None:
+            return
+        
+        started, baseline, start = state
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            if started:
+                tracemalloc.stop()
+        finally:
+            self._active.release()
+        
+        if baseline is not None:
+            stats = [(stat.traceback, stat.size_diff) for stat in snapshot.compare_to(baseline, 'traceback')]
+        else:
+            stats = [(stat.traceback, stat.size) for stat in snapshot.statistics('traceback')]
+        
+        sites = Counter()
+        for traceback, size in stats:
+            if size > 0:
+                sites[self._site(traceback)] += size
+        
+        with self._lock:
+            entry = self.endpoints.setdefault(request.endpoint or '<unmatched>', EndpointMemory())
+            entry.count += 1
+            entry.peak_total += peak - start
+            entry.peak_max = max(entry.peak_max, peak - start)
+            entry.retained_total += max(current - start, 0)
+            entry.sites.update(sites)
+            # Keep the site table from growing with every new traceback
+            if len(entry.sites) > 200:
+                entry.sites = Counter(dict(entry.sites.most_common(100)))
+    
+    def _site(self, traceback):
+        frames = list(traceback)
+        for frame in reversed(frames):
+            if frame.filename.startswith(self.root):
+                filename = os.path.relpath(frame.filename, os.path.dirname(self.root.rstrip(os.sep)))
+                break
+        else:
+            frame = frames[-1]
+            filename = frame.filename.rpartition('site-packages' + os.sep)[2]
+        return f'{filename}:{frame.lineno}'
+    
+    def summary(self):
+        """Sampled endpoints, largest average peak first"""
+        with self._lock:
+            entries = list(self.endpoints.items())
+        return sorted(entries, key=lambda item: item[1].peak_avg, reverse=True)
+    
+    def clear(self):
+        with self._lock:
+            self.endpoints.clear()
@@ -0,0 +1,174 @@
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import namedtuple
+from flask import jsonify, make_response, request, session
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock, the in-process lock still applies
+    fcntl = None
+
+# key hash, tokens left, time of last refill, time the bucket is full again
+_SLOT = struct.Struct('Qddd')
+
+# Slots looked at for each key before the least useful one is overwritten
+PROBES = 8
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+_RULE = re.compile(r'^(?:(?P<methods>[A-Z]+(?:,[A-Z]+)*)\s+)?(?P<limit>\d+)\s*/\s*(?P<count>\d+)?\s*'
+                   r'(?P<unit>second|minute|hour|day)s?(?:\s+per\s+(?P<per>user|ip))?$')
+
+Rule = namedtuple('Rule', ('limit', 'period', 'per', 'methods'))
+
+def parse_rule(text):
+    """Parse '[METHODS] <limit>/[n] <unit> [per user|ip]', e.g. 'POST 10/minute per ip'"""
+    match = _RULE.match(text.strip())
+    if match is None:
+        raise ValueError(f'Invalid rate limit {text!r}')
+    period = int(match['count'] or 1) * PERIODS[match['unit']]
+    methods = frozenset(match['methods'].split(',')) if match['methods'] else None
+    return Rule(int(match['limit']), period, match['per'] or 'user', methods)
+
+class BucketTable:
+    """Fixed-size open-addressing table of token buckets, 32 bytes each.
+
+    Without a path the table lives in this process's memory. With a path it
+    is a memory-mapped file that every worker on the host maps, updated under
+    an exclusive flock. A bucket that has refilled completely is equivalent
+    to a missing one, so its slot is simply reused; when all probed slots are
+    busy the one that will be full soonest is given up, which can only make
+    the limit more lenient for that key.
+    """
+
+    def __init__(self, path=None, slots=65536):
+        self._lock = threading.Lock()
+        self._fd = None
+        size = slots * _SLOT.size
+        if path is None:
+            self._map = bytearray(size)
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            size = os.fstat(self._fd).st_size
+            self._map = mmap.mmap(self._fd, size)
+        self.slots = size // _SLOT.size
+
+    def take(self, key, capacity, rate, now):
+        """Take one token from key's bucket, returning (allowed, seconds until one is available)"""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        with self._lock:
+            if self._fd is not None and fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                return self._take(digest, capacity, rate, now)
+            finally:
+                if self._fd is not None and fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _take(self, digest, capacity, rate, now):
+        found = free = oldest = None
+        oldest_full_at = math.inf
+        for i in range(PROBES):
+            offset = (digest + i) % self.slots * _SLOT.size
+            slot_digest, tokens, stamp, full_at = _SLOT.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                found = offset
+                break
+            if free is None and (slot_digest == 0 or full_at <= now):
+                free = offset
+            elif full_at < oldest_full_at:
+                oldest, oldest_full_at = offset, full_at
+
+        if found is not None:
+            tokens = min(capacity, tokens + max(now - stamp, 0) * rate)
+        else:
+            found = free if free is not None else oldest
+            tokens = capacity
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        _SLOT.pack_into(self._map, found, digest, tokens, now, now + (capacity - tokens) / rate)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+class RateLimiter:
+    """Token-bucket rate limits per endpoint and client, checked before any database work.
+
+    RATE_LIMITS maps endpoint names to rules such as '60/minute' or
+    'POST 10/minute per ip'. A bucket holds up to the limit and refills over
+    the period, so short bursts pass while a steady flood gets 429 with a
+    Retry-After header. 'per user' (the default) keys the bucket on the user
+    id from the session cookie, falling back to the client address for
+    anonymous requests; 'per ip' always uses the address. Buckets are per
+    worker unless RATE_LIMIT_STORAGE names a file shared by all workers.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.rules = {}
+        self.storage = None
+        self.slots = 65536
+        self._table = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import metrics
+
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', self.enabled)
+        self.rules = {endpoint: parse_rule(rule) for endpoint, rule in app.config.get('RATE_LIMITS', {}).items()}
+        self.storage = app.config.get('RATE_LIMIT_STORAGE')
+        self.slots = app.config.get('RATE_LIMIT_SLOTS', self.slots)
+        # Registered even with METRICS_ENABLED off, inc() is then a no-op
+        self.rejected = metrics.counter('rate_limited_total', 'Requests rejected with 429 by the rate limiter',
+                                        ('endpoint',))
+
+        if self.enabled and self.rules:
+            app.before_request(self._check)
+
+    def table(self):
+        """This process's bucket table, reopened after a fork so flock works per worker"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._table = BucketTable(self.storage, self.slots)
+                    self._pid = pid
+        return self._table
+
+    def identity(self, rule):
+        user_id = session.get('_user_id') if rule.per == 'user' else None
+        return f'user:{user_id}' if user_id else f'ip:{request.remote_addr}'
+
+    def _check(self):
+        rule = self.rules.get(request.endpoint)
+        if rule is None or (rule.methods and request.method not in rule.methods):
+            return None
+
+        key = f'{request.endpoint}|{self.identity(rule)}'
+        allowed, retry_after = self.table().take(key, rule.limit, rule.limit / rule.period, time.time())
+        if allowed:
+            return None
+
+        self.rejected.inc(endpoint=request.endpoint)
+        message = 'Too many requests, please slow down and try again shortly'
+        if request.path.startswith('/api/') or request.is_json:
+            response = jsonify({'success': False, 'message': message})
+        else:
+            response = make_response(message)
+            response.mimetype = 'text/plain'
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import current_user, login_required
-from app import db
+from app import db, cache_bus, sharded_stock
+from app.archive import archive_totals, find_order
 from app.models import User, UserRole, Product, Category, Order, Store
+from app.passwords import HashingBusy
+from app.search import search_orders, search_users
 from app.utils import save_picture
 from functools import wraps
 
@@ -24,13 +27,15 @@ def dashboard():
     # Get counts for overview
     user_count = User.query.count()
     product_count = Product.query.count()
-    order_count = Order.query.count()
+    # Archived orders only live in the running totals
+    archived_orders, archived_sales = archive_totals()
+    order_count = Order.query.count() + archived_orders
     
     # Get recent orders
     recent_orders = Order.query.order_by(Order.order_date.desc()).limit(5).all()
     
     # Get sales data
-    total_sales = db.session.query(db.func.sum(Order.total_price)).scalar() or 0
+    total_sales = (db.session.query(db.func.sum(Order.total_price)).scalar() or 0) + archived_sales
     
     # Get user role distribution
     customer_count = User.query.filter_by(role=UserRole.CUSTOMER).count()
@@ -68,12 +73,7 @@ def user_list():
         query = query.filter_by(role=UserRole(role))
     
     if search:
-        query = query.filter(
-            (User.username.ilike(f'%{search}%')) |
-            (User.email.ilike(f'%{search}%')) |
-            (User.first_name.ilike(f'%{search}%')) |
-            (User.last_name.ilike(f'%{search}%'))
-        )
+        query = search_users(query, search)
     
     # Paginate results
     users = query.order_by(User.date_registered.desc()).paginate(page=page, per_page=per_page)
@@ -119,8 +119,14 @@ def user_edit(user_id):
         # Handle password change if provided
         new_password = request.form.get('new_password')
         if new_password:
-            user.set_password(new_password)
+            try:
+                user.set_password(new_password)
+            except HashingBusy as e:
+                db.session.rollback()
+                flash(str(e), 'warning')
+                return render_template('admin/user_edit.html', title='Edit User', user=user), 503
         
+        cache_bus.publish(f'user:{user.id}')
         db.session.commit()
         flash(f'User {user.username} has been updated successfully!', 'success')
         return redirect(url_for('admin.user_list'))
@@ -142,6 +148,7 @@ def user_delete(user_id):
         return redirect(url_for('admin.user_list'))
     
     db.session.delete(user)
+    cache_bus.publish(f'user:{user.id}')
     db.session.commit()
     
     flash(f'User {user.username} has been deleted!', 'success')
@@ -197,7 +204,7 @@ def product_edit(product_id):
         product.name = request.form.get('name')
         product.description = request.form.get('description')
         product.price = float(request.form.get('price'))
-        product.stock = int(request.form.get('stock'))
+        sharded_stock.set_stock(product, int(request.form.get('stock')))
         product.category_id = int(request.form.get('category_id'))
         product.is_featured = 'is_featured' in request.form
         
@@ -209,6 +216,7 @@ def product_edit(product_id):
             except Exception as e:
                 flash(f'Error uploading image: {str(e)}', 'danger')
         
+        cache_bus.publish(f'product:{product.id}')
         db.session.commit()
         flash(f'Product {product.name} has been updated successfully!', 'success')
         return redirect(url_for('admin.product_list'))
@@ -229,6 +237,7 @@ def product_delete(product_id):
     product = Product.query.get_or_404(product_id)
     
     db.session.delete(product)
+    cache_bus.publish(f'product:{product.id}')
     db.session.commit()
     
     flash(f'Product {product.name} has been deleted!', 'success')
@@ -254,10 +263,7 @@ def order_list():
         query = query.filter_by(status=status)
     
     if search:
-        query = query.join(User).filter(
-            (User.username.ilike(f'%{search}%')) |
-            (User.email.ilike(f'%{search}%'))
-        )
+        query = search_orders(query, search)
     
     # Paginate results
     orders = query.order_by(Order.order_date.desc()).paginate(page=page, per_page=per_page)
@@ -273,9 +279,13 @@ def order_list():
 @admin_required
 def order_detail(order_id):
     """View and update order status"""
-    order = Order.query.get_or_404(order_id)
+    order = find_order(order_id)
     
     if request.method == 'POST':
+        if order.archived:
+            flash(f'Order #{order.id} is archived and can no longer be changed', 'warning')
+            return redirect(url_for('admin.order_detail', order_id=order.id))
+        
         # Update order status
         order.status = request.form.get('status')
         db.session.commit()
@@ -317,6 +327,8 @@ def category_add():
         )
         
         db.session.add(category)
+        db.session.flush()  # To get category ID
+        cache_bus.publish(f'category:{category.id}')
         db.session.commit()
         
         flash(f'Category {name} has been added!', 'success')
@@ -344,6 +356,7 @@ def category_edit(category_id):
         category.name = name
         category.description = request.form.get('description')
         
+        cache_bus.publish(f'category:{category.id}')
         db.session.commit()
         flash(f'Category {category.name} has been updated!', 'success')
         return redirect(url_for('admin.category_list'))
@@ -365,6 +378,7 @@ def category_delete(category_id):
         return redirect(url_for('admin.category_list'))
     
     db.session.delete(category)
+    cache_bus.publish(f'category:{category.id}')
     db.session.commit()
     
     flash(f'Category {category.name} has been deleted!', 'success')
@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, current_user, logout_user, login_required
 from werkzeug.urls import url_parse
-from app import db
+from app import db, cache_bus, password_hasher
 from app.models import User
+from app.passwords import HashingBusy
 from app.utils import validate_email, validate_password
 
 auth = Blueprint('auth', __name__)
@@ -25,10 +26,23 @@ def login():
         
         # Check if user exists and password is correct
         user = User.query.filter_by(email=email).first()
-        if user is None or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HashingBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/login.html', title='Login'), 503
+        if not valid:
             flash('Invalid email or password', 'danger')
             return render_template('auth/login.html', title='Login')
         
+        # Upgrade hashes made with an older method or cost while the password is at hand
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass  # Try again at the next login
+        
         # Log in the user
         login_user(user, remember=remember)
         
@@ -82,7 +96,11 @@ def register():
         
         # Create new user
         user = User(username=username, email=email)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy as e:
+            flash(str(e), 'warning')
+            return render_template('auth/register.html', title='Register'), 503
         
         db.session.add(user)
         db.session.commit()
@@ -113,8 +131,11 @@ def profile():
         current_user.zip_code = request.form.get('zip_code', current_user.zip_code)
         current_user.phone = request.form.get('phone', current_user.phone)
         
+        cache_bus.publish(f'user:{current_user.id}')
         db.session.commit()
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('auth.profile'))
     
-    return render_template('auth/profile.html', title='My Profile')
\ No newline at end of file
+    return render_template('auth/profile.html',
+                          recent_orders=current_user.recent_orders(),
+                          title='My Profile')
\ No newline at end of file
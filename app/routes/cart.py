@@ -1,15 +1,17 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import current_user, login_required
-from app import db
-from app.models import Product, CartItem
+from app import db, metrics, object_cache
+from app.models import CartItem
 
 cart = Blueprint('cart', __name__)
 
+cart_adds = metrics.counter('shop_cart_adds_total', 'Products added to carts')
+
 @cart.route('/cart')
 @login_required
 def view_cart():
     """View shopping cart contents"""
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_items = object_cache.cart_lines(CartItem.query.filter_by(user_id=current_user.id).all())
     total = sum(item.quantity * item.product.price for item in cart_items)
     
     return render_template('cart/view.html', 
@@ -21,14 +23,14 @@ def view_cart():
 @login_required
 def add_to_cart(product_id):
     """Add a product to the shopping cart"""
-    product = Product.query.get_or_404(product_id)
+    product = object_cache.get_product_or_404(product_id)
     
     # Get quantity from form data, default to 1
     quantity = int(request.form.get('quantity', 1))
     
     # Check if product is in stock
-    if product.stock < quantity:
-        flash(f'Sorry, only {product.stock} items available', 'warning')
+    if product.available_stock < quantity:
+        flash(f'Sorry, only {product.available_stock} items available', 'warning')
         return redirect(url_for('products.product_detail', product_id=product_id))
     
     # Check if product is already in cart
@@ -52,6 +54,7 @@ def add_to_cart(product_id):
         flash(f'Added {product.name} to your cart', 'success')
     
     db.session.commit()
+    cart_adds.inc()
     return redirect(url_for('cart.view_cart'))
 
 @cart.route('/cart/update/<int:item_id>', methods=['POST'])
@@ -69,8 +72,9 @@ def update_cart(item_id):
     quantity = int(request.form.get('quantity', 1))
     
     # Check if product is in stock
-    if cart_item.product.stock < quantity:
-        flash(f'Sorry, only {cart_item.product.stock} items available', 'warning')
+    product = object_cache.get_product_or_404(cart_item.product_id)
+    if product.available_stock < quantity:
+        flash(f'Sorry, only {product.available_stock} items available', 'warning')
         return redirect(url_for('cart.view_cart'))
     
     if quantity > 0:
@@ -116,17 +120,17 @@ def clear_cart():
 @login_required
 def api_add_to_cart(product_id):
     """AJAX endpoint for adding a product to the cart"""
-    product = Product.query.get_or_404(product_id)
+    product = object_cache.get_product_or_404(product_id)
     
     # Get quantity from JSON data, default to 1
     data = request.get_json()
     quantity = int(data.get('quantity', 1)) if data else 1
     
     # Check if product is in stock
-    if product.stock < quantity:
+    if product.available_stock < quantity:
         return jsonify({
             'success': False,
-            'message': f'Sorry, only {product.stock} items available'
+            'message': f'Sorry, only {product.available_stock} items available'
         }), 400
     
     # Check if product is already in cart
@@ -150,6 +154,7 @@ def api_add_to_cart(product_id):
         message = f'Added {product.name} to your cart'
     
     db.session.commit()
+    cart_adds.inc()
     
     return jsonify({
         'success': True,
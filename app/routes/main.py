@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request
-from app.models import Product, Category
+from app import object_cache
+from app.models import Product
 
 main = Blueprint('main', __name__)
 
@@ -8,7 +9,7 @@ main = Blueprint('main', __name__)
 def home():
     """Home page route showing featured products"""
     featured_products = Product.query.filter_by(is_featured=True).limit(4).all()
-    categories = Category.query.all()
+    categories = object_cache.all_categories()
     return render_template('home.html', 
                           featured_products=featured_products,
                           categories=categories,
@@ -0,0 +1,68 @@
+import hmac
+from flask import Blueprint, Response, abort, current_app, flash, redirect, render_template, request, url_for
+from flask_login import login_required
+from app import memory_profiler, metrics, profiler, slow_query_log
+from app.routes.admin import admin_required
+
+monitoring = Blueprint('monitoring', __name__)
+
+@monitoring.route('/admin/monitoring/requests')
+@login_required
+@admin_required
+def request_profile():
+    """Per-endpoint request timings from the profiler ring buffer"""
+    return render_template('admin/request_profile.html',
+                          title='Request Profile',
+                          endpoints=profiler.summary(),
+                          sample_count=len(profiler.samples),
+                          sample_limit=profiler.samples.maxlen)
+
+@monitoring.route('/admin/monitoring/slow-queries')
+@login_required
+@admin_required
+def slow_queries():
+    """Slow statements grouped by fingerprint, with their latest query plan"""
+    return render_template('admin/slow_queries.html',
+                          title='Slow Queries',
+                          entries=slow_query_log.summary(),
+                          threshold=slow_query_log.threshold)
+
+@monitoring.route('/admin/monitoring/slow-queries/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_slow_queries():
+    """Reset the slow query log of this worker"""
+    slow_query_log.clear()
+    flash('Slow query log cleared', 'success')
+    return redirect(url_for('monitoring.slow_queries'))
+
+@monitoring.route('/admin/monitoring/memory')
+@login_required
+@admin_required
+def memory_profile():
+    """Peak and retained allocations of sampled requests per endpoint"""
+    return render_template('admin/memory_profile.html',
+                          title='Memory Profile',
+                          endpoints=memory_profiler.summary(),
+                          sample_rate=memory_profiler.sample_rate)
+
+@monitoring.route('/admin/monitoring/memory/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_memory_profile():
+    """Reset the memory samples of this worker"""
+    memory_profiler.clear()
+    flash('Memory profile cleared', 'success')
+    return redirect(url_for('monitoring.memory_profile'))
+
+@monitoring.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of the metrics of every worker"""
+    if not metrics.enabled:
+        abort(404)
+    
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    
+    return Response(metrics.generate(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
-from app.models import Product, Category
-from app import db
+from app.models import Product
+from app import db, object_cache
 
 products = Blueprint('products', __name__)
 
@@ -20,7 +20,7 @@ def list_products():
     # Apply category filter if provided
     if category_id:
         query = query.filter_by(category_id=category_id)
-        category = Category.query.get_or_404(category_id)
+        category = object_cache.get_category_or_404(category_id)
         title = f'{category.name} Products'
     else:
         title = 'All Products'
@@ -39,7 +39,7 @@ def list_products():
     products = query.paginate(page=page, per_page=per_page)
     
     # Get all categories for the sidebar
-    categories = Category.query.all()
+    categories = object_cache.all_categories()
     
     return render_template('products/list.html', 
                           products=products,
@@ -51,7 +51,7 @@ def list_products():
 @products.route('/products/<int:product_id>')
 def product_detail(product_id):
     """Display product details"""
-    product = Product.query.get_or_404(product_id)
+    product = object_cache.get_product_or_404(product_id)
     
     # Get related products (same category)
     related_products = Product.query.filter(
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import current_user, login_required
-from app import db
+from app import db, cache_bus, sharded_stock
 from app.models import User, UserRole, Product, Category, Store
 from app.utils import save_picture
 from functools import wraps
@@ -32,6 +32,7 @@ def dashboard():
             user_id=current_user.id
         )
         db.session.add(store)
+        cache_bus.publish(f'user:{current_user.id}')
         db.session.commit()
     
     # Get counts for overview
@@ -150,7 +151,7 @@ def product_edit(product_id):
         product.name = request.form.get('name')
         product.description = request.form.get('description')
         product.price = float(request.form.get('price'))
-        product.stock = int(request.form.get('stock'))
+        sharded_stock.set_stock(product, int(request.form.get('stock')))
         product.category_id = int(request.form.get('category_id'))
         product.is_featured = 'is_featured' in request.form
         
@@ -162,6 +163,7 @@ def product_edit(product_id):
             except Exception as e:
                 flash(f'Error uploading image: {str(e)}', 'danger')
         
+        cache_bus.publish(f'product:{product.id}')
         db.session.commit()
         flash(f'Product {product.name} has been updated successfully!', 'success')
         return redirect(url_for('seller.product_list'))
@@ -186,6 +188,7 @@ def product_delete(product_id):
         abort(403)
     
     db.session.delete(product)
+    cache_bus.publish(f'product:{product.id}')
     db.session.commit()
     
     flash(f'Product {product.name} has been deleted!', 'success')
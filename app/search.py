@@ -0,0 +1,106 @@
+from sqlalchemy import column, or_, select, table
+
+# On SQLite the searched columns are mirrored into external-content FTS5
+# tables with the trigram tokenizer, which answers case-insensitive substring
+# (and so prefix) matches of three or more characters from the index.
+# Triggers keep them in sync with every write: registration, profile and
+# admin edits, order placement and bulk loads. Other databases, and words
+# shorter than a trigram, fall back to ILIKE.
+
+# index name -> (content table, indexed columns)
+INDEXES = {
+    'user_search': ('user', ('username', 'email', 'first_name', 'last_name')),
+    'order_search': ('order', ('shipping_address', 'shipping_city', 'shipping_state', 'shipping_zip',
+                               'shipping_phone'))
+}
+
+TRIGRAM = 3
+
+def _supported(conn):
+    return conn.dialect.name == 'sqlite'
+
+def _quoted(names, prefix=''):
+    return ', '.join(f'{prefix}"{name}"' for name in names)
+
+def create_search_index(conn, rebuild=False):
+    """Create the search tables and their sync triggers, filling tables that are new"""
+    if not _supported(conn):
+        return
+    existing = {name for name, in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, (content, columns) in INDEXES.items():
+        if name not in existing:
+            conn.exec_driver_sql(
+                f'CREATE VIRTUAL TABLE "{name}" USING fts5({_quoted(columns)}, '
+                f"content='{content}', content_rowid='id', tokenize='trigram')"
+            )
+        # External content tables are updated by replaying the old row as a 'delete'
+        insert = f'INSERT INTO "{name}" (rowid, {_quoted(columns)}) VALUES (new.id, {_quoted(columns, "new.")});'
+        delete = (f'INSERT INTO "{name}" ("{name}", rowid, {_quoted(columns)}) '
+                  f"VALUES ('delete', old.id, {_quoted(columns, 'old.')});")
+        conn.exec_driver_sql(f'CREATE TRIGGER IF NOT EXISTS "{name}_insert" AFTER INSERT ON "{content}" '
+                             f'BEGIN {insert} END')
+        conn.exec_driver_sql(f'CREATE TRIGGER IF NOT EXISTS "{name}_delete" AFTER DELETE ON "{content}" '
+                             f'BEGIN {delete} END')
+        conn.exec_driver_sql(f'CREATE TRIGGER IF NOT EXISTS "{name}_update" AFTER UPDATE OF {_quoted(columns)} '
+                             f'ON "{content}" BEGIN {delete} {insert} END')
+        if rebuild or name not in existing:
+            conn.exec_driver_sql(f'INSERT INTO "{name}" ("{name}") VALUES (\'rebuild\')')
+
+def drop_search_triggers(conn):
+    """Stop syncing during bulk loads; create_search_index(conn, rebuild=True) catches up"""
+    if not _supported(conn):
+        return
+    for name in INDEXES:
+        for action in ('insert', 'delete', 'update'):
+            conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS "{name}_{action}"')
+
+def _match(name, words):
+    """Ids of the rows of index name that contain every word"""
+    index = table(name, column('rowid'), column(name))
+    phrases = ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+    return select(index.c.rowid).where(index.c[name].match(phrases))
+
+def _ilike(columns, word):
+    return or_(*(field.ilike(f'%{word}%') for field in columns))
+
+def _filter(query, name, id_column, columns, search, extra=None):
+    from app import db
+
+    words = search.split()
+    indexed = [word for word in words if len(word) >= TRIGRAM]
+    if indexed and _supported(db.engine):
+        clause = id_column.in_(_match(name, indexed))
+        if extra is not None:
+            clause = or_(clause, extra(indexed))
+        query = query.filter(clause)
+        words = [word for word in words if len(word) < TRIGRAM]
+
+    # Short words, or the whole search without an index, narrow the rows with ILIKE
+    for word in words:
+        clause = _ilike(columns, word)
+        if extra is not None:
+            clause = or_(clause, extra([word], like=True))
+        query = query.filter(clause)
+    return query
+
+def search_users(query, search):
+    """Filter a User query to users whose username, email or name contains every word of search"""
+    from app.models import User
+
+    columns = [getattr(User, name) for name in INDEXES['user_search'][1]]
+    return _filter(query, 'user_search', User.id, columns, search)
+
+def search_orders(query, search):
+    """Filter an Order query by shipping details or the customer's username, email or name"""
+    from app.models import Order, User
+
+    def by_customer(words, like=False):
+        users = select(User.id)
+        if like:
+            users = users.where(*(_ilike([getattr(User, name) for name in INDEXES['user_search'][1]], word)
+                                  for word in words))
+            return Order.user_id.in_(users)
+        return Order.user_id.in_(_match('user_search', words))
+
+    columns = [getattr(Order, name) for name in INDEXES['order_search'][1]]
+    return _filter(query, 'order_search', Order.id, columns, search, by_customer)
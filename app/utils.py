@@ -1,6 +1,5 @@
 import os
 import secrets
-from PIL import Image
 from flask import current_app
 import re
 
@@ -19,6 +18,8 @@ def save_picture(form_picture, folder='product_pics'):
     picture_path = os.path.join(folder_path, picture_fn)
     
     # Resize and save the image
+    from PIL import Image  # Imported on first upload, not at every worker start
+    
     output_size = (800, 800)  # Max dimensions while preserving aspect ratio
     i = Image.open(form_picture)
     
@@ -45,4 +46,12 @@ def format_price(price):
 
 def generate_order_number():
     """Generate a unique order number"""
-    return f"ORD-{secrets.token_hex(6).upper()}"
\ No newline at end of file
+    return f"ORD-{secrets.token_hex(6).upper()}"
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
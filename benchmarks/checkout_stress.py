@@ -0,0 +1,258 @@
+"""Stress concurrent checkout of a few scarce products and verify no oversell.
+
+Worker processes, each with several shopper threads, race to buy a handful of
+low-stock products through the real app on one file-backed SQLite database
+until everything is sold or time is up. Afterwards the database is checked:
+
+- stock never went negative (a trigger records any moment it did)
+- the order items of each product add up to its stock decrease
+- every successful checkout has exactly one complete order, and failed
+  checkouts left no orders or items behind
+
+The script exits with status 1 if any invariant is violated:
+
+    python -m benchmarks.checkout_stress --processes 4 --threads 8 --products 3 --stock 100
+
+Pass --shards K to split the stock of each scarce product across K counters.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import (CHECKOUT_FORM, create_shoppers, login, make_app, make_config,
+                               parse_overrides)
+
+# Units left in a product, sharded or not
+STOCK = 'stock + (SELECT COALESCE(SUM(stock), 0) FROM stock_shard WHERE product_id = product.id)'
+
+def prepare(workdir, products, stock, shoppers, overrides, shards=0):
+    """Seed the database and leave only a few scarce products in stock"""
+    from app import db, sharded_stock
+    from app.models import Product
+    
+    app = make_app(workdir, **overrides)
+    emails = create_shoppers(app, shoppers)
+    with app.app_context():
+        product_ids = [product_id for product_id, in db.session.query(Product.id).order_by(Product.id).limit(products)]
+        Product.query.update({Product.stock: 0})
+        Product.query.filter(Product.id.in_(product_ids)).update({Product.stock: stock})
+        if shards:
+            for product in Product.query.filter(Product.id.in_(product_ids)):
+                sharded_stock.shard(product, shards)
+        db.session.commit()
+    
+    database = os.path.join(workdir, 'benchmark.db')
+    with sqlite3.connect(database) as conn:
+        conn.executescript('''
+            CREATE TABLE stress_violation (product_id INTEGER, stock INTEGER);
+            CREATE TRIGGER stress_negative_stock AFTER UPDATE OF stock ON product
+            WHEN NEW.stock < 0 BEGIN
+                INSERT INTO stress_violation VALUES (NEW.id, NEW.stock);
+            END;
+            CREATE TRIGGER stress_negative_shard AFTER UPDATE OF stock ON stock_shard
+            WHEN NEW.stock < 0 BEGIN
+                INSERT INTO stress_violation VALUES (NEW.product_id, NEW.stock);
+            END;
+        ''')
+    return emails, product_ids
+
+def worker(workdir, emails, product_ids, seconds, go_file, overrides):
+    """Child process: one logged-in client per email buying until sold out or timed out"""
+    from flask import got_request_exception
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+    
+    app = create_app(make_config(workdir, **overrides))
+    app.logger.disabled = True
+    database = os.path.join(workdir, 'benchmark.db')
+    local = threading.local()
+    
+    def record_exception(sender, exception, **extra):
+        local.exception = exception
+    
+    got_request_exception.connect(record_exception, app)
+    
+    totals = Counter()
+    lock = threading.Lock()
+    window = {}
+    clients = []
+    for email in emails:
+        client = app.test_client()
+        login(client, email)
+        clients.append(client)
+    
+    def sold_out():
+        conn = sqlite3.connect(database, timeout=30)
+        try:
+            placeholders = ','.join('?' * len(product_ids))
+            return not conn.execute(f'SELECT SUM({STOCK}) FROM product WHERE id IN ({placeholders})',
+                                    product_ids).fetchone()[0]
+        except sqlite3.OperationalError:
+            return False  # Locked by a writer, so someone is still buying
+        finally:
+            conn.close()
+    
+    def shopper(index, client):
+        counts = Counter()
+        try:
+            shop(index, client, counts)
+        finally:
+            with lock:
+                window['finished_at'] = max(window.get('finished_at', 0), time.time())
+                totals.update(counts)
+    
+    def shop(index, client, counts):
+        while time.time() < window['deadline']:
+            product_id = product_ids[(index + counts['attempts']) % len(product_ids)]
+            local.exception = None
+            client.post(f'/api/cart/add/{product_id}', json={'quantity': 1})
+            response = client.post('/place-order', data=CHECKOUT_FORM)
+            counts['attempts'] += 1
+            
+            if '/order-confirmation/' in response.headers.get('Location', ''):
+                counts['orders'] += 1
+                continue
+            if isinstance(local.exception, OperationalError) and 'locked' in str(local.exception):
+                counts['lock_timeouts'] += 1
+            elif response.status_code >= 500:
+                counts['errors'] += 1
+            else:
+                counts['rejected'] += 1
+            client.post('/cart/clear')
+            if sold_out():
+                break
+    
+    # Wait for the parent so every process starts buying at the same moment
+    print('ready', flush=True)
+    while not os.path.exists(go_file):
+        time.sleep(0.005)
+    window['started_at'] = time.time()
+    window['deadline'] = window['started_at'] + seconds
+    
+    threads = [threading.Thread(target=shopper, args=(i, client)) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({**totals, 'started_at': window['started_at'], 'finished_at': window['finished_at']}))
+
+def check_invariants(workdir, product_ids, stock, orders_placed):
+    """Return a list of human-readable invariant violations"""
+    violations = []
+    with sqlite3.connect(os.path.join(workdir, 'benchmark.db')) as conn:
+        for product_id, negative in conn.execute('SELECT product_id, MIN(stock) FROM stress_violation GROUP BY 1'):
+            violations.append(f'product {product_id} stock went negative ({negative})')
+        
+        for product_id in product_ids:
+            remaining = conn.execute(f'SELECT {STOCK} FROM product WHERE id = ?', (product_id,)).fetchone()[0]
+            sold = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_item WHERE product_id = ?',
+                                (product_id,)).fetchone()[0]
+            if sold != stock - remaining:
+                violations.append(f'product {product_id}: items sold {sold} != stock decrease {stock - remaining}')
+        
+        orders = conn.execute('SELECT COUNT(*) FROM "order"').fetchone()[0]
+        if orders != orders_placed:
+            violations.append(f'{orders} orders in the database but {orders_placed} checkouts succeeded')
+        empty = conn.execute('SELECT COUNT(*) FROM "order" o WHERE NOT EXISTS '
+                             '(SELECT 1 FROM order_item i WHERE i.order_id = o.id)').fetchone()[0]
+        if empty:
+            violations.append(f'{empty} orders have no items')
+        mismatched = conn.execute('SELECT COUNT(*) FROM "order" o WHERE item_count != '
+                                  '(SELECT SUM(quantity) FROM order_item i WHERE i.order_id = o.id)').fetchone()[0]
+        if mismatched:
+            violations.append(f'{mismatched} orders have an item_count that does not match their items')
+        orphans = conn.execute('SELECT COUNT(*) FROM order_item i WHERE NOT EXISTS '
+                               '(SELECT 1 FROM "order" o WHERE o.id = i.order_id)').fetchone()[0]
+        if orphans:
+            violations.append(f'{orphans} order items belong to no order')
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='shoppers per process')
+    parser.add_argument('--products', type=int, default=3, help='scarce products to fight over')
+    parser.add_argument('--stock', type=int, default=50, help='initial stock of each scarce product')
+    parser.add_argument('--shards', type=int, default=0, help='split the stock of each scarce product this many ways')
+    parser.add_argument('--seconds', type=float, default=30, help='give up after this long')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='config override, value parsed as JSON if possible')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--worker', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    
+    if args.worker:
+        workdir, go_file, job = args.worker
+        job = json.loads(job)
+        worker(workdir, job['emails'], job['product_ids'], args.seconds, go_file, overrides)
+        return
+    
+    with tempfile.TemporaryDirectory(prefix='bench-stress-') as workdir:
+        emails, product_ids = prepare(workdir, args.products, args.stock, args.processes * args.threads, overrides,
+                                       args.shards)
+        go_file = os.path.join(workdir, 'go')
+        
+        children = []
+        for i in range(args.processes):
+            job = json.dumps({'emails': emails[i * args.threads:(i + 1) * args.threads], 'product_ids': product_ids})
+            children.append(subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.checkout_stress', '--worker', workdir, go_file, job,
+                 '--seconds', str(args.seconds)] + [f'--set={pair}' for pair in args.set],
+                stdout=subprocess.PIPE, text=True
+            ))
+        for child in children:
+            assert child.stdout.readline().strip() == 'ready'
+        open(go_file, 'w').close()
+        
+        totals = Counter()
+        started_at, finished_at = float('inf'), 0
+        for child in children:
+            output, _ = child.communicate()
+            result = json.loads(output.strip().splitlines()[-1])
+            started_at = min(started_at, result.pop('started_at'))
+            finished_at = max(finished_at, result.pop('finished_at'))
+            totals.update(result)
+        
+        violations = check_invariants(workdir, product_ids, args.stock, totals['orders'])
+    
+    elapsed = finished_at - started_at
+    result = {
+        'processes': args.processes,
+        'threads': args.threads,
+        'products': args.products,
+        'stock': args.stock,
+        'shards': args.shards,
+        'config': overrides,
+        'seconds': round(elapsed, 2),
+        'attempts': totals['attempts'],
+        'orders': totals['orders'],
+        'rejected': totals['rejected'],
+        'lock_timeouts': totals['lock_timeouts'],
+        'errors': totals['errors'],
+        'orders_per_sec': round(totals['orders'] / elapsed, 1) if elapsed else 0,
+        'lock_timeout_rate': round(totals['lock_timeouts'] / totals['attempts'], 4) if totals['attempts'] else 0,
+        'violations': violations
+    }
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['orders']} orders of {args.products * args.stock} units in {result['seconds']}s "
+              f"({result['orders_per_sec']} orders/s) by {args.processes}x{args.threads} shoppers")
+        print(f"{result['attempts']} attempts: {result['rejected']} rejected, "
+              f"{result['lock_timeouts']} lock timeouts ({result['lock_timeout_rate']:.2%}), {result['errors']} errors")
+        print('\n'.join(f'VIOLATION: {violation}' for violation in violations) or 'All invariants hold')
+    
+    if violations:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config import Config
+
+# One PBKDF2 round so creating benchmark users doesn't dominate setup time
+FAST_HASH = 'pbkdf2:sha256:1'
+PASSWORD = 'benchmark'
+
+# Form posted to /place-order by simulated shoppers
+CHECKOUT_FORM = {
+    'payment_method': 'credit_card',
+    'shipping_address': '1 Benchmark Street',
+    'shipping_city': 'Testville',
+    'shipping_state': 'TS',
+    'shipping_zip': '12345',
+    'shipping_phone': '555-0100'
+}
+
+def parse_overrides(pairs):
+    """Config overrides from KEY=VALUE strings, values parsed as JSON when possible"""
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+def make_config(workdir, **overrides):
+    """Config subclass pointing the database and shared files into workdir"""
+    attrs = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        'CACHE_BUS_PATH': os.path.join(workdir, 'cache_bus'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        # Otherwise every shopper's FAST_HASH would be upgraded at login
+        'PASSWORD_HASH_METHOD': FAST_HASH,
+        # Every shopper comes from 127.0.0.1 and shops far faster than a person
+        'RATE_LIMIT_ENABLED': False
+    }
+    attrs.update(overrides)
+    return type('BenchmarkConfig', (Config,), attrs)
+
+def make_app(workdir, **overrides):
+    """Create a quiet app instance backed by a fresh database in workdir"""
+    from app import create_app
+    from app.models import init_db, initialize_db
+    
+    app = create_app(make_config(workdir, **overrides))
+    app.logger.disabled = True
+    with app.app_context():
+        init_db()
+        initialize_db()
+    return app
+
+def create_shoppers(app, count):
+    """Create customer accounts with a profile address and return their emails"""
+    from app import db
+    from app.models import User
+    
+    password_hash = generate_password_hash(PASSWORD, method=FAST_HASH)
+    with app.app_context():
+        users = [
+            User(
+                username=f'shopper{i}',
+                email=f'shopper{i}@example.com',
+                password_hash=password_hash,
+                address=CHECKOUT_FORM['shipping_address'],
+                city=CHECKOUT_FORM['shipping_city'],
+                state=CHECKOUT_FORM['shipping_state'],
+                zip_code=CHECKOUT_FORM['shipping_zip'],
+                phone=CHECKOUT_FORM['shipping_phone']
+            )
+            for i in range(count)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.email for user in users]
+
+def login(client, email):
+    return client.post('/login', data={'email': email, 'password': PASSWORD})
+
+def run_shoppers(app, emails, seconds, step):
+    """Run one logged-in client per email calling step(client, index) until time is up.
+    
+    step returns a dict of counters for that iteration; the summed counters
+    are returned once every shopper has stopped.
+    """
+    import threading
+    import time
+    from collections import Counter
+    
+    totals = Counter()
+    lock = threading.Lock()
+    window = {}
+    
+    def start_clock():
+        window['deadline'] = time.perf_counter() + seconds
+    
+    barrier = threading.Barrier(len(emails), action=start_clock)
+    
+    def shopper(index, email):
+        client = app.test_client()
+        login(client, email)
+        barrier.wait()
+        
+        while time.perf_counter() < window['deadline']:
+            counts = step(client, index)
+            with lock:
+                totals.update(counts)
+    
+    workers = [threading.Thread(target=shopper, args=(i, email)) for i, email in enumerate(emails)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return dict(totals)
+
+def checkout_step(product_ids):
+    """Shopper iteration that adds one product to the cart and places an order"""
+    def step(client, index):
+        product_id = product_ids[index % len(product_ids)]
+        added = client.post(f'/api/cart/add/{product_id}', json={'quantity': 1}).status_code == 200
+        response = client.post('/place-order', data=CHECKOUT_FORM)
+        placed = '/order-confirmation/' in response.headers.get('Location', '')
+        return {'cart_adds': added, 'orders': placed, 'errors': (not added) + (not placed)}
+    return step
+
+def restock(app, stock=10 ** 9):
+    """Give every product enough stock and return the product ids"""
+    from app import db
+    from app.models import Product
+    
+    with app.app_context():
+        Product.query.update({Product.stock: stock})
+        db.session.commit()
+        return [product_id for product_id, in db.session.query(Product.id).order_by(Product.id)]
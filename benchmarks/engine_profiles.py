@@ -0,0 +1,65 @@
+"""Compare cart and checkout throughput across database engine profiles.
+
+Each profile runs in a fresh subprocess against its own SQLite file, with
+one thread per simulated shopper adding to the cart and placing orders:
+
+    python -m benchmarks.engine_profiles --threads 8 --seconds 10
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import checkout_step, create_shoppers, make_app, restock, run_shoppers
+
+PROFILES = ('default', 'sqlite')
+
+def run_profile(profile, threads, seconds):
+    with tempfile.TemporaryDirectory(prefix=f'bench-{profile}-') as workdir:
+        app = make_app(workdir, DB_ENGINE_PROFILE=profile)
+        emails = create_shoppers(app, threads)
+        counts = run_shoppers(app, emails, seconds, checkout_step(restock(app)))
+    
+    return {
+        'profile': profile,
+        'threads': threads,
+        'seconds': seconds,
+        **counts,
+        'orders_per_sec': round(counts.get('orders', 0) / seconds, 1),
+        'requests_per_sec': round((counts.get('cart_adds', 0) + counts.get('orders', 0)) / seconds, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES))
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run:
+        print(json.dumps(run_profile(args.run, args.threads, args.seconds)))
+        return
+    
+    results = []
+    for profile in args.profiles:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.engine_profiles', '--run', profile,
+             '--threads', str(args.threads), '--seconds', str(args.seconds)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print(f"{'profile':<10}{'orders/s':>10}{'req/s':>10}{'errors':>8}")
+    for result in results:
+        print(f"{result['profile']:<10}{result['orders_per_sec']:>10}"
+              f"{result['requests_per_sec']:>10}{result.get('errors', 0):>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare per-request checkout commits with the group-commit order writer.
+
+Each mode runs in a fresh subprocess against its own SQLite file:
+
+    python -m benchmarks.group_commit --threads 16 --seconds 10
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import checkout_step, create_shoppers, make_app, restock, run_shoppers
+
+MODES = ('per-request', 'group-commit')
+
+def run_mode(mode, threads, seconds):
+    from app import order_writer
+    
+    with tempfile.TemporaryDirectory(prefix=f'bench-{mode}-') as workdir:
+        app = make_app(workdir, ORDER_WRITER_ENABLED=(mode == 'group-commit'))
+        emails = create_shoppers(app, threads)
+        counts = run_shoppers(app, emails, seconds, checkout_step(restock(app)))
+    
+    orders = counts.get('orders', 0)
+    return {
+        'mode': mode,
+        'threads': threads,
+        'seconds': seconds,
+        **counts,
+        'orders_per_sec': round(orders / seconds, 1),
+        'orders_per_batch': round(order_writer.orders / order_writer.batches, 1) if order_writer.batches else 1
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.threads, args.seconds)))
+        return
+    
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.group_commit', '--run', mode,
+             '--threads', str(args.threads), '--seconds', str(args.seconds)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print(f"{'mode':<14}{'orders/s':>10}{'per batch':>11}{'errors':>8}")
+    for result in results:
+        print(f"{result['mode']:<14}{result['orders_per_sec']:>10}"
+              f"{result['orders_per_batch']:>11}{result.get('errors', 0):>8}")
+
+if __name__ == '__main__':
+    main()
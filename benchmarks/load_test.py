@@ -0,0 +1,192 @@
+"""End-to-end HTTP load test of the storefront through a local WSGI server.
+
+The app is served from a separate process so client threads don't compete
+with it for the GIL. Every simulated shopper logs in and repeats the flow
+home -> product list -> product detail -> add to cart -> checkout -> place
+order until time is up; latency and throughput are reported per endpoint:
+
+    python -m benchmarks.load_test --shoppers 16 --seconds 30 --json > before.json
+    python -m benchmarks.load_test --shoppers 16 --seconds 30 --set ORDER_WRITER_ENABLED=true
+"""
+import argparse
+import http.client
+import json
+import logging
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from benchmarks.common import (CHECKOUT_FORM, PASSWORD, create_shoppers, make_app, make_config,
+                               parse_overrides, restock)
+
+FLOW = ('main.home', 'products.list_products', 'products.product_detail',
+        'cart.api_add_to_cart', 'orders.checkout', 'orders.place_order')
+
+HIDDEN_INPUT = re.compile(r'name="(checkout_key|quote)" value="([^"]*)"')
+
+class Shopper:
+    """One keep-alive connection with its own session cookie"""
+    
+    def __init__(self, port, results):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookies = {}
+        self.results = results
+    
+    def request(self, endpoint, method, path, body=None, content_type=None, expect=(200,)):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if content_type:
+            headers['Content-Type'] = content_type
+        
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.results[endpoint].append((time.perf_counter() - start, False))
+            return None, b''
+        self.results[endpoint].append((time.perf_counter() - start, response.status in expect))
+        
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response, data
+    
+    def login(self, email):
+        form = urlencode({'email': email, 'password': PASSWORD})
+        self.request('auth.login', 'POST', '/login', form, 'application/x-www-form-urlencoded', expect=(302,))
+    
+    def run_flow(self, product_id):
+        self.request('main.home', 'GET', '/')
+        self.request('products.list_products', 'GET', '/products')
+        self.request('products.product_detail', 'GET', f'/products/{product_id}')
+        self.request('cart.api_add_to_cart', 'POST', f'/api/cart/add/{product_id}',
+                     json.dumps({'quantity': 1}), 'application/json')
+        
+        _, page = self.request('orders.checkout', 'GET', '/checkout')
+        form = dict(CHECKOUT_FORM, **dict(HIDDEN_INPUT.findall(page.decode(errors='replace'))))
+        response, _ = self.request('orders.place_order', 'POST', '/place-order', urlencode(form),
+                                   'application/x-www-form-urlencoded', expect=(302,))
+        return response is not None and '/order-confirmation/' in (response.getheader('Location') or '')
+
+def serve(workdir, overrides):
+    """Child process: serve the app on a free port and print the port"""
+    from werkzeug.serving import make_server
+    from app import create_app
+    
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app(make_config(workdir, **overrides))
+    app.logger.disabled = True
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def summarize(results, seconds):
+    from app.utils import percentile
+    
+    endpoints = {}
+    for endpoint in FLOW:
+        samples = results.get(endpoint, [])
+        durations = [duration * 1000 for duration, _ in samples]
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok in samples if not ok),
+            'requests_per_sec': round(len(samples) / seconds, 1),
+            'mean_ms': round(sum(durations) / len(durations), 2) if durations else 0,
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p95_ms': round(percentile(durations, 95), 2),
+            'p99_ms': round(percentile(durations, 99), 2)
+        }
+    return endpoints
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shoppers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='config override for the server, value parsed as JSON if possible')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    
+    if args.serve:
+        serve(args.serve, overrides)
+        return
+    
+    with tempfile.TemporaryDirectory(prefix='bench-load-') as workdir:
+        app = make_app(workdir, **overrides)
+        emails = create_shoppers(app, args.shoppers)
+        product_ids = restock(app)
+        
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.load_test', '--serve', workdir] +
+            [f'--set={pair}' for pair in args.set],
+            stdout=subprocess.PIPE, text=True
+        )
+        try:
+            port = int(server.stdout.readline())
+            results = defaultdict(list)
+            flows = []
+            window = {}
+            
+            def start_clock():
+                window['deadline'] = time.perf_counter() + args.seconds
+            
+            barrier = threading.Barrier(args.shoppers, action=start_clock)
+            
+            def shopper(index, email):
+                own = defaultdict(list)
+                client = Shopper(port, own)
+                client.login(email)
+                own.clear()
+                barrier.wait()
+                completed = 0
+                while time.perf_counter() < window['deadline']:
+                    completed += client.run_flow(product_ids[index % len(product_ids)])
+                flows.append(completed)
+                for endpoint, samples in own.items():
+                    results[endpoint].extend(samples)
+            
+            threads = [threading.Thread(target=shopper, args=(i, email)) for i, email in enumerate(emails)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+    
+    endpoints = summarize(results, args.seconds)
+    result = {
+        'shoppers': args.shoppers,
+        'seconds': args.seconds,
+        'config': overrides,
+        'flows': sum(flows),
+        'flows_per_sec': round(sum(flows) / args.seconds, 1),
+        'requests_per_sec': round(sum(entry['requests'] for entry in endpoints.values()) / args.seconds, 1),
+        'endpoints': endpoints
+    }
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    
+    print(f"{'endpoint':<26}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for endpoint, entry in endpoints.items():
+        print(f"{endpoint:<26}{entry['requests_per_sec']:>8}{entry['p50_ms']:>9}"
+              f"{entry['p95_ms']:>9}{entry['p99_ms']:>9}{entry['errors']:>8}")
+    print(f"\n{result['flows']} checkouts, {result['flows_per_sec']} flows/s, "
+          f"{result['requests_per_sec']} req/s with {args.shoppers} shoppers")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Microbenchmarks of hot internals with stored baselines and a compare mode.
+
+Record a baseline on the main branch, then compare a change against it on
+the same machine; compare exits with status 1 when any benchmark got slower
+than the tolerance allows. The committed benchmarks/baselines/micro.json
+was recorded on a reference machine, so re-record it before comparing
+anywhere else:
+
+    python -m benchmarks.micro --save
+    python -m benchmarks.micro --compare --tolerance 0.15
+    python -m benchmarks.micro --only render
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+
+from benchmarks.common import ROOT, make_app
+from config import Config
+
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'micro.json')
+
+def make_image(size, image_format):
+    """Encoded bytes of a noisy image, so decoding and compression do real work"""
+    from PIL import Image
+    
+    data = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(data, image_format)
+    return data.getvalue()
+
+def setup(app, workdir):
+    """Return {name: callable} for every benchmark, sharing one seeded database"""
+    from flask import Flask, render_template
+    from werkzeug.datastructures import FileStorage
+    from app import db, object_cache
+    from app.datagen import DataGenerator
+    from app.models import CartItem, Product, User
+    from app.pricing import compute_quote
+    from app.utils import save_picture
+    
+    with app.app_context():
+        DataGenerator(seed=0, echo=lambda message: None).run(categories=8, users=10, products=200)
+        user = User.query.filter(User.username.like('user%')).first()
+        user.set_password('benchmark')
+        db.session.add_all([CartItem(user_id=user.id, product_id=product_id, quantity=2)
+                            for product_id in range(1, 11)])
+        db.session.commit()
+        user_id = user.id
+    
+    def in_app(func):
+        def run():
+            with app.app_context():
+                return func()
+        return run
+    
+    def cart_total():
+        return db.session.get(User, user_id).get_cart_total()
+    
+    def checkout_total():
+        return compute_quote(user_id).total
+    
+    def check_password():
+        return db.session.get(User, user_id).check_password('benchmark')
+    
+    def render_list(per_page):
+        def render():
+            with app.test_request_context('/products'):
+                products = Product.query.order_by(Product.name).paginate(page=1, per_page=per_page)
+                return render_template('products/list.html', products=products,
+                                       categories=object_cache.all_categories(),
+                                       current_category=None, sort_by='name', title='All Products')
+        return render
+    
+    with app.app_context():
+        products = Product.query.limit(48).all()
+        for product in products:
+            db.session.expunge(product)
+    
+    def to_dict():
+        return [product.to_dict() for product in products]
+    
+    # save_picture writes under current_app.root_path, point that at workdir
+    upload_app = Flask('uploads', root_path=workdir)
+    
+    def save(size, image_format):
+        data = make_image(size, image_format)
+        
+        def run():
+            upload = FileStorage(io.BytesIO(data), filename=f'upload.{image_format.lower()}')
+            with upload_app.app_context():
+                path = save_picture(upload)
+            os.remove(os.path.join(workdir, 'static', path))
+        return run
+    
+    return {
+        'cart_total': in_app(cart_total),
+        'checkout_total': in_app(checkout_total),
+        'check_password': in_app(check_password),
+        'render_list_12': render_list(12),
+        'render_list_48': render_list(48),
+        'product_to_dict_48': to_dict,
+        'save_picture_jpeg_3000x2000': save((3000, 2000), 'JPEG'),
+        'save_picture_png_1200x1200': save((1200, 1200), 'PNG')
+    }
+
+def measure(func, repeat, min_time):
+    """Median and best microseconds per call over repeat timed runs"""
+    func()  # Warm caches and lazy imports
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time and number < 1 << 20:
+        number *= 2
+    runs = [seconds / number * 1e6 for seconds in timer.repeat(repeat, number)]
+    return {'median_us': round(statistics.median(runs), 2), 'best_us': round(min(runs), 2), 'calls': number * repeat}
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table and return the names that regressed"""
+    regressed = []
+    print(f"{'benchmark':<30}{'baseline us':>14}{'current us':>14}{'change':>9}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<30}{'-':>14}{result['median_us']:>14}{'new':>9}")
+            continue
+        change = result['median_us'] / before['median_us'] - 1
+        flag = ''
+        if change > tolerance:
+            regressed.append(name)
+            flag = '  REGRESSED'
+        print(f"{name:<30}{before['median_us']:>14}{result['median_us']:>14}{change:>+9.1%}{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', default=[], help='run benchmarks whose name contains any of these')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timed run')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='fail if slower than the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown, 0.15 is 15%%')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    
+    # Fail before spending minutes on the benchmarks
+    if args.compare and not os.path.exists(args.baseline):
+        parser.exit(2, f'No baseline at {args.baseline}, record one with --save first\n')
+    
+    with tempfile.TemporaryDirectory(prefix='bench-micro-') as workdir:
+        # check_password should measure the production hash, not the benchmarks' cheap one
+        app = make_app(workdir, PASSWORD_HASH_METHOD=Config.PASSWORD_HASH_METHOD)
+        benchmarks = setup(app, workdir)
+        results = {}
+        for name, func in benchmarks.items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            results[name] = measure(func, args.repeat, args.min_time)
+            if not args.json:
+                print(f"{name:<30}{results[name]['median_us']:>14} us", file=sys.stderr)
+    
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.baseline}', file=sys.stderr)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+    
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} benchmark(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
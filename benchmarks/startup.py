@@ -0,0 +1,88 @@
+"""Measure cold-start time of importing the app package and calling create_app.
+
+Each run is a fresh interpreter started with -X importtime against an
+already initialised database, so the numbers are what every worker fork and
+test process pays before it can serve a request:
+
+    python -m benchmarks.startup --runs 5 --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ROOT, make_app
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_app_ms': (done - imported) * 1000}))
+'''
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} for the top-level imports"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, only top-level ones add up to the total
+        if not name.startswith('  '):
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def cold_start(workdir):
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+               CACHE_BUS_PATH=os.path.join(workdir, 'cache_bus'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD],
+                             cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(process.stderr)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as workdir:
+        # Create and seed the database up front, startup itself must not need to
+        make_app(workdir)
+        runs = [cold_start(workdir) for _ in range(args.runs)]
+    
+    modules = runs[-1]['modules']
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    result = {
+        'runs': args.runs,
+        'import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+        'create_app_ms': round(statistics.median(run['create_app_ms'] for run in runs), 1),
+        'importtime_total_ms': round(sum(cumulative for _, cumulative in modules.values()) / 1000, 1),
+        'slowest_imports': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1)}
+                            for name, (_, cumulative) in slowest]
+    }
+    result['total_ms'] = round(result['import_ms'] + result['create_app_ms'], 1)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    
+    print(f"import app       {result['import_ms']:>8} ms")
+    print(f"create_app()     {result['create_app_ms']:>8} ms")
+    print(f"total            {result['total_ms']:>8} ms  (median of {args.runs} runs)")
+    print(f"\n{'slowest imports':<40}{'ms':>8}")
+    for entry in result['slowest_imports']:
+        print(f"{entry['module']:<40}{entry['cumulative_ms']:>8}")
+
+if __name__ == '__main__':
+    main()
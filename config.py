@@ -1,13 +1,12 @@
 import os
-import sqlite3
 from datetime import timedelta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 db_path = os.path.join(basedir, "ecommerce.db")
 
-# Pastikan database file exists
-conn = sqlite3.connect(db_path)
-conn.close()
+def optional_float(value):
+    """Float from an environment value, None for an empty value, 'off' or 'none'"""
+    return None if value.strip().lower() in ('', 'off', 'none') else float(value)
 
 class Config:
     # Secret key for session management and CSRF protection
@@ -17,6 +16,34 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{db_path}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Schema creation and sample data run from 'flask db-init' and 'flask seed'.
+    # DB_AUTO_INIT does both once on the first request instead, for development
+    DB_AUTO_INIT = os.environ.get('DB_AUTO_INIT') == '1'
+    
+    # Engine profile: 'sqlite' applies the pragmas below on every connection,
+    # 'server' configures the connection pool, 'default' leaves both alone
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE') or (
+        'sqlite' if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else 'server')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,         # ms
+        'cache_size': -20000,         # KiB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY'
+    }
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_RECYCLE = 1800
+    
+    # Read replicas, comma separated. Reads from REPLICA_ENDPOINTS go to a
+    # random replica unless the client wrote within READ_YOUR_WRITES_SECONDS
+    DATABASE_REPLICA_URLS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+    SQLALCHEMY_BINDS = {f'replica_{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+    REPLICA_ENDPOINTS = ['main.*', 'products.*', 'admin.dashboard', 'admin.user_list',
+                         'admin.product_list', 'admin.order_list', 'admin.category_list']
+    READ_YOUR_WRITES_SECONDS = 5
+    
     # Upload folder for product images
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     
@@ -26,5 +53,118 @@ class Config:
     # Session lifetime
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # Cross-worker cache invalidation: shared counter file (defaults to the
+    # instance folder), how long change log entries are kept and, on
+    # databases other than SQLite, how far back each sync re-reads them to
+    # catch entries committed out of id order (longer than any transaction)
+    CACHE_BUS_PATH = os.environ.get('CACHE_BUS_PATH')
+    CACHE_BUS_RETENTION = timedelta(hours=1)
+    CACHE_BUS_OVERLAP = timedelta(seconds=30)
+    
+    # Maximum number of product and category snapshots kept per worker
+    PRODUCT_CACHE_SIZE = 2048
+    CATEGORY_CACHE_SIZE = 256
+    
+    # Seconds a cached user identity is trusted before re-reading the User row
+    USER_CACHE_TTL = 30
+    USER_CACHE_SIZE = 4096
+    
+    # Password hashing runs on a small thread pool per worker so a burst of
+    # logins can't tie up every CPU. Method strings are Werkzeug's, e.g.
+    # 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'; hashes made with another
+    # method are upgraded at the user's next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE_SIZE = 32   # waiting hashes before logins are turned away
+    PASSWORD_HASH_TIMEOUT = 10      # seconds a request waits for its hash
+    
+    # Token-bucket limits for endpoints that are expensive per request, as
+    # '[METHODS] <limit>/[n] <second|minute|hour|day> [per user|ip]'. Buckets
+    # are per worker unless RATE_LIMIT_STORAGE names a file all workers on the
+    # host share. Behind a proxy, apply ProxyFix so the client address is real
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    RATE_LIMITS = {
+        'auth.login': 'POST 10/minute per ip',
+        'auth.register': 'POST 5/minute per ip',
+        'main.search': '60/minute',
+        'cart.api_add_to_cart': '120/minute'
+    }
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE')
+    RATE_LIMIT_SLOTS = 65536  # 32 bytes each, busiest clients win when full
+    
+    # Sharded stock for flash-sale products, opted into per product with
+    # 'flask shard-stock'. Concurrent checkouts decrement different counter
+    # rows; pages show the shard total, cached per worker for the TTL
+    STOCK_SHARDS = 8
+    STOCK_SHARD_CACHE_TTL = 1.0  # seconds
+    
+    # Group-commit checkout: orders are queued to one writer thread per worker
+    # and committed in batches instead of one transaction per request
+    ORDER_WRITER_ENABLED = os.environ.get('ORDER_WRITER_ENABLED') == '1'
+    ORDER_WRITER_BATCH_SIZE = 32
+    ORDER_WRITER_MAX_WAIT = 0.005  # seconds to wait for a batch to fill
+    ORDER_WRITER_TIMEOUT = 10      # seconds a request waits for its order
+    
+    # 'flask archive-orders' moves delivered orders older than this into the
+    # archive tables, a batch per transaction
+    ORDER_ARCHIVE_AFTER = timedelta(days=365)
+    ORDER_ARCHIVE_BATCH_SIZE = 500
+    ORDER_ARCHIVE_PAUSE = 0.05  # seconds between batches so checkouts get the write lock
+    
+    # Maintenance run by 'flask maintenance --loop' (or the single-shot
+    # sweep-carts and optimize-db commands from cron). Carts whose newest item
+    # is older than CART_ITEM_TTL are deleted in short batched transactions;
+    # ANALYZE runs on its own schedule and VACUUM only once DB_VACUUM_FREE_RATIO
+    # of the file is free pages, since it locks the whole database
+    CART_ITEM_TTL = timedelta(days=30)
+    CART_SWEEP_BATCH_SIZE = 1000
+    CART_SWEEP_PAUSE = 0.05                      # seconds between batches
+    CART_SWEEP_INTERVAL = timedelta(hours=1)
+    DB_OPTIMIZE_INTERVAL = timedelta(days=1)
+    DB_VACUUM_FREE_RATIO = 0.2
+    
+    # Transactional outbox for post-order side effects. The in-process worker
+    # can be disabled when a separate 'flask outbox-drain --loop' runs instead
+    OUTBOX_WORKER_ENABLED = os.environ.get('OUTBOX_WORKER_ENABLED', '1') == '1'
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_POLL_INTERVAL = 5                # seconds between polls when idle
+    OUTBOX_LEASE = timedelta(seconds=60)    # how long a claimed event is reserved
+    OUTBOX_MAX_ATTEMPTS = 5
+    OUTBOX_RETRY_DELAY = 2                  # seconds, doubled after each failure
+    OUTBOX_RETENTION = timedelta(days=7)    # done events are purged by 'flask maintenance'
+    
+    # Idempotent checkout: how long submitted checkout keys are remembered and
+    # how long a repeated submit waits for the first one to finish
+    CHECKOUT_KEY_TTL = timedelta(hours=24)
+    CHECKOUT_KEY_WAIT = 5  # seconds
+    
+    # Seconds a signed checkout quote stays valid
+    CHECKOUT_QUOTE_TTL = 15 * 60
+    
+    # Request profiler: Server-Timing headers plus the last N requests per worker
+    PROFILER_ENABLED = True
+    PROFILER_SAMPLES = 1000
+    
+    # Statements slower than this many seconds are logged and EXPLAINed (None,
+    # or 'off' in the environment, disables). Up to SLOW_QUERY_MAX_ENTRIES
+    # fingerprints are kept per worker
+    SLOW_QUERY_THRESHOLD = optional_float(os.environ.get('SLOW_QUERY_THRESHOLD', '0.1'))
+    SLOW_QUERY_MAX_ENTRIES = 200
+    SLOW_QUERY_SAMPLES = 200            # durations kept per fingerprint for percentiles
+    SLOW_QUERY_EXPLAIN_INTERVAL = 60    # seconds before re-explaining a fingerprint
+    
+    # Fraction of requests traced with tracemalloc, off by default since tracing
+    # slows the whole worker while a sampled request runs
+    MEMORY_PROFILER_SAMPLE_RATE = float(os.environ.get('MEMORY_PROFILER_SAMPLE_RATE', 0))
+    MEMORY_PROFILER_FRAMES = 15
+    
+    # Prometheus metrics: each worker writes its own file in METRICS_DIR (defaults
+    # to the instance folder) and /metrics sums them. Clear the directory when
+    # deploying. Set METRICS_TOKEN to require 'Authorization: Bearer <token>'
+    METRICS_ENABLED = True
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_COLLECT_INTERVAL = 5  # seconds between pool and cache gauge refreshes
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
     # Payment settings (replace with actual keys in production)
     PAYMENT_API_KEY = os.environ.get('PAYMENT_API_KEY') or 'dummy-payment-api-key'
\ No newline at end of file
@@ -0,0 +1,31 @@
+import re
+from sqlalchemy.exc import OperationalError
+from benchmarks.common import CHECKOUT_FORM, create_shoppers, login, make_app
+
+def test_failed_checkout_releases_key(tmp_path, monkeypatch):
+    from app.models import CheckoutRequest, Order
+    import app.routes.orders as routes
+
+    app = make_app(str(tmp_path))
+    email, = create_shoppers(app, 1)
+    client = app.test_client()
+    login(client, email)
+    client.post('/api/cart/add/3', json={'quantity': 1})
+    key = re.search(rb'name="checkout_key" value="([^"]+)"', client.get('/checkout').data).group(1).decode()
+    form = dict(CHECKOUT_FORM, checkout_key=key)
+
+    def locked(*args, **kwargs):
+        raise OperationalError('UPDATE product', {}, Exception('database is locked'))
+
+    create_order = routes.create_order
+    monkeypatch.setattr(routes, 'create_order', locked)
+    assert client.post('/place-order', data=form).status_code == 500
+    with app.app_context():
+        assert CheckoutRequest.query.count() == 0
+
+    monkeypatch.setattr(routes, 'create_order', create_order)
+    response = client.post('/place-order', data=form)
+    assert '/order-confirmation/' in response.headers['Location']
+    with app.app_context():
+        order = Order.query.one()
+        assert CheckoutRequest.query.one().order_id == order.id